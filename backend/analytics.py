@@ -0,0 +1,286 @@
+"""
+Аналитика портфеля по журналу сделок.
+
+Сделки пользователя загружаются курсором драйвера в массивы NumPy (время
+исполнения и прибыль), которые остаются в памяти процесса, сохраняются в
+таблицу deal_snapshots и дополняются только новыми сделками; после этого все показатели считаются векторно:
+кривая капитала, максимальная просадка, доля прибыльных сделок,
+profit factor, средние прибыль и убыток, коэффициенты Шарпа и Сортино
+по дневному PnL и скользящий PnL за ANALYTICS_ROLLING_DAYS дней.
+Результат кэшируется в analytics_cache и сбрасывается при записи сделок.
+"""
+import logging
+import math
+import os
+
+import numpy as np
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend.cache import MemoryBackend, TTLCache, analytics_cache
+import backend.crud as crud
+from backend.database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Окно скользящего PnL в днях
+ANALYTICS_ROLLING_DAYS = int(os.getenv("ANALYTICS_ROLLING_DAYS", "7"))
+# Сколько точек кривой капитала и скользящего PnL отдавать клиенту
+ANALYTICS_CURVE_POINTS = int(os.getenv("ANALYTICS_CURVE_POINTS", "200"))
+# Число торговых дней в году для годовых коэффициентов (крипторынок работает без выходных)
+TRADING_DAYS_PER_YEAR = 365
+# Массивы сделок (max id, время, прибыль, сделок в снимке) по user_id в памяти процесса
+ANALYTICS_DEALS_SIZE = int(os.getenv("ANALYTICS_DEALS_SIZE", "32"))
+ANALYTICS_DEALS_TTL = float(os.getenv("ANALYTICS_DEALS_TTL", "3600"))
+# С какого числа сделок массивы сохраняются в deal_snapshots
+ANALYTICS_SNAPSHOT_MIN_DEALS = int(os.getenv("ANALYTICS_SNAPSHOT_MIN_DEALS", "50000"))
+
+deals_cache = TTLCache("analytics-deals", ttl=ANALYTICS_DEALS_TTL, maxsize=ANALYTICS_DEALS_SIZE,
+                       backend=MemoryBackend(ANALYTICS_DEALS_SIZE))
+
+_DAY = np.timedelta64(1, "D")
+# Форматы массивов в deal_snapshots (с явным порядком байтов)
+_SNAPSHOT_EXECUTED_AT = np.dtype("<M8[us]")
+_SNAPSHOT_PROFIT = np.dtype("<f8")
+
+
+def _placeholder(conn) -> str:
+    return "?" if conn.dialect.paramstyle == "qmark" else "%s"
+
+
+def _fetch(conn, sql: str, params: tuple):
+    # Курсор драйвера без обработки строк SQLAlchemy: на миллионе сделок
+    # это в разы быстрее, чем select() с построчным приведением типов
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(sql.replace("?", _placeholder(conn)), params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _to_arrays(rows, first: int = 0):
+    """Столбцы rows начиная с first: время исполнения и прибыль."""
+    if not rows:
+        return np.empty(0, dtype="datetime64[us]"), np.empty(0, dtype=np.float64)
+    executed_at = np.array([row[first] for row in rows], dtype="datetime64[us]")
+    profit = np.fromiter((row[first + 1] for row in rows), dtype=np.float64, count=len(rows))
+    return executed_at, profit
+
+
+def _deals_stats(conn, user_id: int, max_id=None):
+    """Максимальный id и число сделок пользователя (с id не больше max_id)."""
+    sql = "SELECT MAX(id), COUNT(*) FROM deals WHERE user_id = ?"
+    params = (user_id,)
+    if max_id is not None:
+        sql += " AND id <= ?"
+        params += (max_id,)
+    return _fetch(conn, sql, params)[0]
+
+
+def _load_all(conn, user_id: int):
+    max_id, _ = _deals_stats(conn, user_id)
+    if max_id is None:
+        return 0, *_to_arrays([]), 0
+    # Граница по id делает загрузку согласованной со счетчиком сделок
+    rows = _fetch(conn, "SELECT executed_at, COALESCE(profit, 0) FROM deals "
+                        "WHERE user_id = ? AND id <= ? ORDER BY executed_at, id",
+                  (user_id, max_id))
+    return max_id, *_to_arrays(rows), 0
+
+
+def _load_snapshot(conn, user_id: int):
+    """Массивы из deal_snapshots в формате deals_cache или None, если снимка нет."""
+    rows = _fetch(conn, "SELECT max_id, executed_at, profit FROM deal_snapshots WHERE user_id = ?",
+                  (user_id,))
+    if not rows or rows[0][0] is None:
+        return None
+    max_id, executed_at, profit = rows[0]
+    executed_at = np.frombuffer(executed_at, dtype=_SNAPSHOT_EXECUTED_AT)
+    profit = np.frombuffer(profit, dtype=_SNAPSHOT_PROFIT)
+    if len(executed_at) != len(profit):
+        return None
+    return max_id, executed_at, profit, len(profit)
+
+
+def _save_snapshot(user_id: int, loaded):
+    """Сохраняет массивы в deal_snapshots отдельной транзакцией; ошибка не мешает расчету."""
+    max_id, executed_at, profit, _ = loaded
+    db = SessionLocal()
+    try:
+        crud.set_deal_snapshot(db, user_id, max_id,
+                               executed_at.astype(_SNAPSHOT_EXECUTED_AT).tobytes(),
+                               profit.astype(_SNAPSHOT_PROFIT).tobytes())
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Не удалось сохранить снимок сделок пользователя {user_id}: {e}")
+        return False
+    finally:
+        db.close()
+
+
+def _load_new(conn, user_id: int, cached):
+    """
+    Дополняет закэшированные массивы сделками с id больше загруженных.
+    Возвращает None, если массивы разошлись с таблицей (сделки удалены или
+    транзакция с меньшими id зафиксирована позже) и нужна полная загрузка.
+    """
+    max_id, executed_at, profit, saved = cached
+    rows = _fetch(conn, "SELECT id, executed_at, COALESCE(profit, 0) FROM deals "
+                        "WHERE user_id = ? AND id > ? ORDER BY executed_at, id",
+                  (user_id, max_id))
+    if rows:
+        max_id = max(row[0] for row in rows)
+        new_executed_at, new_profit = _to_arrays(rows, first=1)
+        # Новые сделки встают после старых с тем же временем, так как их id больше
+        positions = np.searchsorted(executed_at, new_executed_at, side="right")
+        executed_at = np.insert(executed_at, positions, new_executed_at)
+        profit = np.insert(profit, positions, new_profit)
+    if _deals_stats(conn, user_id, max_id)[1] != len(profit):
+        return None
+    return max_id, executed_at, profit, saved
+
+
+def load_deals_from(conn, user_id: int):
+    """
+    Загружает время исполнения и прибыль сделок пользователя в порядке
+    исполнения через соединение SQLAlchemy conn. Массивы хранятся в памяти
+    процесса (deals_cache), а у пользователей с ANALYTICS_SNAPSHOT_MIN_DEALS
+    сделок и больше — еще и в deal_snapshots, общей для всех воркеров.
+    Из deals читаются только сделки новее загруженных; все сделки —
+    лишь при первом расчете или если массивы разошлись с таблицей.
+    Снимок перезаписывается, когда сделок стало на 10% больше, чем в нем.
+    :return: Пара массивов (datetime64[us], float64).
+    """
+    cached = deals_cache.get(user_id)
+    if cached is None:
+        cached = _load_snapshot(conn, user_id)
+    loaded = _load_new(conn, user_id, cached) if cached is not None else None
+    if loaded is None:
+        loaded = _load_all(conn, user_id)
+    count = len(loaded[2])
+    if count >= ANALYTICS_SNAPSHOT_MIN_DEALS and count - loaded[3] >= max(count // 10, 1):
+        if _save_snapshot(user_id, loaded):
+            loaded = loaded[:3] + (count,)
+    deals_cache.set(user_id, loaded)
+    return loaded[1], loaded[2]
+
+
+def load_deals(db: Session, user_id: int):
+    """То же, что load_deals_from, через соединение сессии db."""
+    return load_deals_from(db.connection(), user_id)
+
+
+def _ratio(numerator: float, denominator: float):
+    return float(numerator / denominator) if denominator else None
+
+
+def _sample(values: np.ndarray, points: int) -> np.ndarray:
+    """Индексы не более points равномерно распределенных элементов (включая последний)."""
+    if len(values) <= points:
+        return np.arange(len(values))
+    return np.unique(np.linspace(0, len(values) - 1, points).round().astype(np.int64))
+
+
+def compute(executed_at: np.ndarray, profit: np.ndarray,
+            rolling_days: int = ANALYTICS_ROLLING_DAYS,
+            points: int = ANALYTICS_CURVE_POINTS) -> dict:
+    """
+    Считает показатели портфеля по массивам сделок, упорядоченным по времени.
+    Капитал считается как накопленная прибыль, начиная с нуля.
+    """
+    count = len(profit)
+    result = {
+        "trades": count,
+        "total_pnl": 0.0,
+        "win_rate": None,
+        "profit_factor": None,
+        "avg_win": None,
+        "avg_loss": None,
+        "max_drawdown": 0.0,
+        "sharpe": None,
+        "sortino": None,
+        "equity_curve": [],
+        "rolling_pnl": [],
+    }
+    if not count:
+        return result
+
+    wins = profit > 0
+    losses = profit < 0
+    win_count = int(np.count_nonzero(wins))
+    loss_count = int(np.count_nonzero(losses))
+    gross_profit = profit[wins].sum()
+    gross_loss = -profit[losses].sum()
+
+    equity = np.cumsum(profit)
+    # Пик считается с учетом начального капитала 0
+    peaks = np.maximum.accumulate(np.maximum(equity, 0.0))
+    drawdowns = peaks - equity
+
+    # Дневной PnL по всем календарным дням от первой до последней сделки
+    days = executed_at.astype("datetime64[D]")
+    day_index = ((days - days[0]) // _DAY).astype(np.int64)
+    daily = np.bincount(day_index, weights=profit)
+    dates = days[0] + np.arange(len(daily)) * _DAY
+    if len(daily) > 1:
+        std = daily.std(ddof=1)
+        downside = math.sqrt(np.mean(np.minimum(daily, 0.0) ** 2))
+        annual = math.sqrt(TRADING_DAYS_PER_YEAR)
+        result["sharpe"] = _ratio(daily.mean() * annual, std)
+        result["sortino"] = _ratio(daily.mean() * annual, downside)
+
+    window = max(rolling_days, 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    rolling = cumulative[window:] - cumulative[:-window] if len(daily) >= window else cumulative[-1:]
+    rolling_dates = dates[window - 1:] if len(daily) >= window else dates[-1:]
+
+    curve = _sample(equity, points)
+    rolling_idx = _sample(rolling, points)
+    result.update(
+        total_pnl=float(equity[-1]),
+        # Сделки с нулевой прибылью (в том числе исполнения, загруженные с бирж) не входят в долю
+        win_rate=_ratio(win_count, win_count + loss_count),
+        profit_factor=_ratio(gross_profit, gross_loss),
+        avg_win=_ratio(gross_profit, win_count),
+        avg_loss=_ratio(-gross_loss, loss_count),
+        max_drawdown=float(drawdowns.max()),
+        equity_curve=[
+            [str(ts), float(value)]
+            for ts, value in zip(executed_at[curve].astype("datetime64[s]"), equity[curve])
+        ],
+        rolling_pnl=[
+            [str(day), float(value)]
+            for day, value in zip(rolling_dates[rolling_idx], rolling[rolling_idx])
+        ],
+    )
+    return result
+
+
+def get_user_analytics(db: Session, user_id: int) -> dict:
+    """Показатели портфеля пользователя (из кэша, если сделки не менялись)."""
+    result = analytics_cache.get(user_id)
+    if result is None:
+        result = compute(*load_deals(db, user_id))
+        analytics_cache.set(user_id, result)
+    return result
+
+
+def _compute_for(user_id: int) -> dict:
+    with engine.connect() as conn:
+        return compute(*load_deals_from(conn, user_id))
+
+
+async def get_user_analytics_async(user_id: int) -> dict:
+    """
+    То же, что get_user_analytics, для async-обработчиков: загрузка сделок
+    и расчет целиком выполняются в пуле потоков на синхронном соединении,
+    не занимая event loop.
+    """
+    result = await analytics_cache.aget(user_id)
+    if result is None:
+        result = await run_in_threadpool(_compute_for, user_id)
+        await analytics_cache.aset(user_id, result)
+    return result
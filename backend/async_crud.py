@@ -0,0 +1,116 @@
+"""
+Асинхронные версии функций backend/crud.py для AsyncSession.
+
+Используются в async-эндпоинтах, чтобы ожидание базы не занимало пул
+потоков. Запросы строятся теми же выражениями select, что и в crud, а
+кэши (credential_cache, user_cache) общие, поэтому синхронный и
+асинхронный пути видят одни и те же данные и сбрасывают одни и те же записи.
+К кэшам async-код обращается через aget/aset/adelete, чтобы общее
+хранилище кэша не блокировало event loop.
+"""
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import backend.crud as crud
+import backend.models as models
+from backend.cache import credential_cache, user_cache
+
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+
+async def get_cached_user(db: AsyncSession, username: str):
+    """Пользователь по username через user_cache (отсоединенный от сессии, см. crud.get_cached_user)."""
+    data = await user_cache.aget(username)
+    if data is not None:
+        return crud.detached_row(models.User, data)
+    user = await get_user_by_username(db, username)
+    if user is None:
+        return None
+    await user_cache.aset(username, crud.row_data(user))
+    db.expunge(user)
+    return user
+
+
+async def update_user(db: AsyncSession, user_id: int, **fields):
+    """Обновляет поля пользователя и сбрасывает его запись в user_cache."""
+    user = await get_user(db, user_id)
+    for name, value in fields.items():
+        setattr(user, name, value)
+    await db.commit()
+    await db.refresh(user)
+    await user_cache.adelete(user.username)
+    return user
+
+
+async def create_user(db: AsyncSession, username: str, hashed_password: str, date_of_birth):
+    user = models.User(
+        username=username,
+        hashed_password=hashed_password,
+        date_of_birth=date_of_birth
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def get_api_keys(db: AsyncSession, user_id: int):
+    """
+    Все API-ключи пользователя через credential_cache.
+    :return: Словарь {биржа: models.APIKey}.
+    """
+    data = await credential_cache.aget(user_id)
+    if data is None:
+        result = await db.execute(select(models.APIKey).where(models.APIKey.user_id == user_id))
+        data = {row.exchange: crud.row_data(row) for row in result.scalars()}
+        await credential_cache.aset(user_id, data)
+    return {exchange: crud.detached_row(models.APIKey, values) for exchange, values in data.items()}
+
+
+async def get_user_balances(db: AsyncSession, user_id: int):
+    """:return: Словарь {биржа: models.Balance}."""
+    result = await db.execute(select(models.Balance).where(models.Balance.user_id == user_id))
+    return {row.exchange: row for row in result.scalars()}
+
+
+async def get_trade_checkpoints(db: AsyncSession, user_id: int):
+    """:return: Словарь {биржа: models.TradeSyncCheckpoint}."""
+    result = await db.execute(select(models.TradeSyncCheckpoint).where(
+        models.TradeSyncCheckpoint.user_id == user_id))
+    return {row.exchange: row for row in result.scalars()}
+
+
+async def get_trade_stats(db: AsyncSession, user_id: int, platform: str = "", crypto_currency: str = ""):
+    """Строка статистики пользователя (по умолчанию — итоговая) или None."""
+    result = await db.execute(select(models.TradeStats).where(
+        models.TradeStats.user_id == user_id,
+        models.TradeStats.platform == platform,
+        models.TradeStats.crypto_currency == crypto_currency
+    ))
+    return result.scalars().first()
+
+
+async def get_equity_series(db: AsyncSession, user_id: int, resolution: str, since: datetime):
+    """:return: Список пар (начало интервала, капитал) по возрастанию времени."""
+    result = await db.execute(crud.equity_series_select(user_id, resolution, since))
+    return crud.equity_series(result.all(), since)
+
+
+async def get_trades_page(db: AsyncSession, user_id: int, limit: int = 50, cursor: str = None,
+                          platform: str = None, crypto_currency: str = None):
+    """
+    Страница истории сделок от новых к старым (см. crud.get_trades_page).
+    :return: Пара (список models.Deal, курсор следующей страницы или None).
+    """
+    stmt = crud.trades_page_select(user_id, limit, cursor, platform, crypto_currency)
+    result = await db.execute(stmt)
+    return crud.split_trades_page(result.scalars().all(), limit)
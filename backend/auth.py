@@ -1,22 +1,45 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status
 import os
+import backend.async_crud as async_crud
 import backend.crud as crud
+from backend.cache import token_cache
+from backend.hashing import password_hasher, pwd_context
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def get_password_hash(password: str) -> str:
+    """Синхронное хэширование в текущем потоке (для служебных задач, не для эндпоинтов)."""
     return pwd_context.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password(password: str) -> str:
+    """Хэширует пароль в пуле процессов (может выбросить hashing.HashingBusy)."""
+    return await password_hasher.hash(password)
+
+async def authenticate_user(db, username: str, password: str):
+    """
+    Проверяет имя и пароль в пуле процессов и возвращает пользователя или None.
+    Хэш, созданный с устаревшими параметрами, пересчитывается и сохраняется.
+    :param db: AsyncSession.
+    """
+    user = await async_crud.get_user_by_username(db, username)
+    if not user:
+        return None
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
+        return None
+    if new_hash:
+        user = await async_crud.update_user(db, user.id, hashed_password=new_hash)
+    return user
+
 def create_access_token(data: dict, expires_delta=None):
     to_encode = data.copy()
     if expires_delta:
@@ -26,19 +49,72 @@ def create_access_token(data: dict, expires_delta=None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user_from_token(token: str, db):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Не удалось проверить учетные данные",
-    )
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _decode_token(token: str):
+    """
+    Проверяет JWT.
+    :return: Пара (имя пользователя, сколько секунд хранить в token_cache) или (None, 0).
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username)
+        return None, 0
+    username = payload.get("sub")
+    if username is None:
+        return None, 0
+    ttl = token_cache.ttl
+    if payload.get("exp") is not None:
+        ttl = min(ttl, payload["exp"] - time.time())
+    return username, ttl
+
+def get_token_username(token: str):
+    """
+    Проверяет JWT и возвращает имя пользователя из claim "sub" или None.
+    Проверенные токены кэшируются по sha256 до истечения их exp.
+    """
+    digest = _token_digest(token)
+    username = token_cache.get(digest)
+    if username is not None:
+        return username
+    username, ttl = _decode_token(token)
+    if username is not None and ttl > 0:
+        token_cache.set(digest, username, ttl=ttl)
+    return username
+
+async def get_token_username_async(token: str):
+    """То же, что get_token_username, без блокировки event loop общим хранилищем кэша."""
+    digest = _token_digest(token)
+    username = await token_cache.aget(digest)
+    if username is not None:
+        return username
+    username, ttl = _decode_token(token)
+    if username is not None and ttl > 0:
+        await token_cache.aset(digest, username, ttl=ttl)
+    return username
+
+def _credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Не удалось проверить учетные данные",
+    )
+
+def get_current_user_from_token(token: str, db):
+    username = get_token_username(token or "")
+    if username is None:
+        raise _credentials_exception()
+    user = crud.get_cached_user(db, username)
+    if user is None:
+        raise _credentials_exception()
+    return user
+
+async def get_current_user_async(token: str, db):
+    """То же, что get_current_user_from_token, для AsyncSession."""
+    username = await get_token_username_async(token or "")
+    if username is None:
+        raise _credentials_exception()
+    user = await async_crud.get_cached_user(db, username)
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
@@ -0,0 +1,88 @@
+"""
+Подготовка базы при запуске: создание таблиц, миграции и мастер-админ.
+
+Выполняется из lifespan приложения и из manage.py, а не при импорте
+модулей, поэтому импорт backend.main (тесты, утилиты) не трогает базу и не
+хэширует пароль. Воркеры uvicorn стартуют одновременно, поэтому подготовка
+идет под межпроцессной блокировкой файла STARTUP_LOCK_FILE: первый
+процесс создает схему и админа, остальные ждут и застают готовую базу.
+Фоновые задачи выполняет один ведущий процесс — тот, кто захватил
+блокировку файла LEADER_LOCK_FILE (см. acquire_leader_lock).
+"""
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+
+from sqlalchemy.orm import sessionmaker
+
+import backend.auth as auth
+import backend.crud as crud
+from backend.migrations import init_db
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка не нужна при запуске одного процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Создавать мастер-админа (admin/admin), если его нет
+SEED_ADMIN = os.getenv("SEED_ADMIN", "1") == "1"
+STARTUP_LOCK_FILE = os.getenv(
+    "STARTUP_LOCK_FILE", os.path.join(tempfile.gettempdir(), "trading-journal-startup.lock"))
+LEADER_LOCK_FILE = os.getenv(
+    "LEADER_LOCK_FILE", os.path.join(tempfile.gettempdir(), "trading-journal-leader.lock"))
+
+
+@contextmanager
+def startup_lock(path: str = STARTUP_LOCK_FILE):
+    """Эксклюзивная блокировка файла, общая для всех процессов на машине."""
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def acquire_leader_lock(path: str = LEADER_LOCK_FILE):
+    """
+    Пытается без ожидания захватить блокировку ведущего процесса.
+    Блокировка держится, пока открыт возвращенный файл; при завершении
+    (в том числе аварийном) процесса ее снимает ОС, и ведущим становится
+    следующий запущенный воркер.
+    :return: Открытый файл блокировки или None, если ведущий процесс уже есть.
+    """
+    lock_file = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+
+def seed_admin(db):
+    """Создает мастер-админа, если его еще нет."""
+    if crud.get_user_by_username(db, "admin"):
+        return
+    crud.create_user(db, "admin", auth.get_password_hash("admin"), date(1970, 1, 1))
+    logger.info("Мастер-админ создан: login=admin, password=admin")
+
+
+def prepare_database(engine, seed: bool = SEED_ADMIN):
+    """Создает схему, применяет миграции и (если seed) создает мастер-админа."""
+    with startup_lock():
+        init_db(engine)
+        if not seed:
+            return
+        db = sessionmaker(bind=engine)()
+        try:
+            seed_admin(db)
+        finally:
+            db.close()
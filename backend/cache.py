@@ -0,0 +1,513 @@
+"""
+Кэши бэкенда.
+
+Каждый кэш (TTLCache) — отдельное пространство имен в хранилище,
+выбранном переменной CACHE_BACKEND:
+  memory — словарь в памяти процесса (по умолчанию; у каждого воркера свой кэш);
+  sqlite — файл SQLite (по умолчанию в каталоге пользователя процесса в
+           /dev/shm), общий для всех процессов машины;
+  redis  — сервер с протоколом Redis (RESP) по адресу CACHE_URL.
+В общих хранилищах значения сериализуются в JSON, поэтому кэш видят и
+сбрасывают все воркеры. В кэш кладутся только простые данные (dict, list,
+str, числа), не объекты ORM.
+Секреты (ключи бирж, хэши паролей) в общее хранилище не попадают: такие
+кэши создаются с private=True и держат значения в памяти процесса, а в
+общем хранилище — только версию ключа. Сброс ключа меняет версию, и
+записи остальных воркеров перестают считаться действительными: сброс
+после /add_api_key по-прежнему доходит до каждого.
+Ошибки общего хранилища не ломают запросы: кэш ведет себя как пустой.
+Обращения к общему хранилищу блокируют поток, поэтому async-код использует
+методы aget/aset/adelete, которые выполняют их в пуле потоков.
+"""
+import logging
+import json
+import math
+import os
+import re
+import socket
+import sqlite3
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+# Для sqlite — путь к файлу, для redis — redis://[:пароль@]хост:порт/база
+CACHE_URL = os.getenv("CACHE_URL", "")
+# Префикс ключей в общем хранилище (несколько приложений на одном Redis)
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "tj")
+# Таймаут операций общего хранилища (сек.)
+CACHE_TIMEOUT = float(os.getenv("CACHE_TIMEOUT", "1"))
+# Как часто (раз в сколько записей) удалять просроченные строки из файла SQLite
+CACHE_PURGE_EVERY = int(os.getenv("CACHE_PURGE_EVERY", "1000"))
+
+
+class CacheError(Exception):
+    """Ошибка, которую вернуло общее хранилище кэша."""
+
+
+class MemoryBackend:
+    """
+    LRU-словарь в памяти процесса с ограничением размера (по одному на кэш).
+    Записи: (значение, свежо до, годно до).
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key, now: float):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if now >= entry[2]:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def set(self, namespace, key, entry: tuple):
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.clear()
+
+    def count(self, namespace, now: float) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class SharedBackend:
+    """
+    Общее для процессов хранилище: ключи вида "<CACHE_PREFIX>:<кэш>:<repr ключа>",
+    записи сериализуются в JSON и удаляются хранилищем по истечении stale-срока.
+    Ограничение размера кэша (maxsize) здесь не действует.
+    """
+
+    def make_key(self, namespace, key) -> str:
+        return f"{self.namespace_prefix(namespace)}{key!r}"
+
+    @staticmethod
+    def namespace_prefix(namespace) -> str:
+        return f"{CACHE_PREFIX}:{namespace}:"
+
+    @staticmethod
+    def dumps(entry: tuple) -> bytes:
+        return json.dumps(entry, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes) -> tuple:
+        return tuple(json.loads(data))
+
+
+def _current_uid():
+    return os.getuid() if hasattr(os, "getuid") else None
+
+
+def _check_owner(path: str):
+    """Отказывается работать с путем-ссылкой или путем, принадлежащим другому пользователю."""
+    st = os.lstat(path)
+    if stat.S_ISLNK(st.st_mode):
+        raise CacheError(f"Путь кэша {path} — символическая ссылка")
+    uid = _current_uid()
+    if uid is not None and st.st_uid != uid:
+        raise CacheError(f"Путь кэша {path} принадлежит другому пользователю")
+    return st
+
+
+class SQLiteBackend(SharedBackend):
+    """
+    Файл SQLite в режиме WAL; у каждого потока свое соединение.
+    Файл создается с правами 0600 (каталог по умолчанию — 0700), а файл или
+    каталог другого пользователя не используется: в кэше лежат данные
+    пользователей, и подложенный чужой файл не должен читаться.
+    """
+
+    def __init__(self, path: str, private_dir: bool = False):
+        self.path = path
+        self.private_dir = private_dir
+        self._local = threading.local()
+        self._writes = 0
+        self._prepared = False
+        self._prepare_lock = threading.Lock()
+
+    def _prepare(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if self.private_dir:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            if _check_owner(directory).st_mode & 0o077:
+                os.chmod(directory, 0o700)
+        for suffix in ("-wal", "-shm"):
+            if os.path.lexists(self.path + suffix):
+                _check_owner(self.path + suffix)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        os.close(fd)
+        if _check_owner(self.path).st_mode & 0o077:
+            os.chmod(self.path, 0o600)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            with self._prepare_lock:
+                if not self._prepared:
+                    self._prepare()
+                    self._prepared = True
+            conn = sqlite3.connect(self.path, timeout=CACHE_TIMEOUT, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Кэш можно потерять при сбое питания: fsync не нужен
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def _namespace_range(self, namespace):
+        # Все ключи пространства имен лежат в диапазоне ["tj:ns:", "tj:ns;")
+        prefix = self.namespace_prefix(namespace)
+        return prefix, prefix[:-1] + ";"
+
+    def get(self, namespace, key, now: float):
+        row = self._connection().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+            (self.make_key(namespace, key), now)).fetchone()
+        return self.loads(row[0]) if row else None
+
+    def set(self, namespace, key, entry: tuple):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (self.make_key(namespace, key), self.dumps(entry), entry[2]))
+        self._writes += 1
+        if self._writes % CACHE_PURGE_EVERY == 0:
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def delete(self, namespace, key):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (self.make_key(namespace, key),))
+
+    def clear(self, namespace):
+        self._connection().execute(
+            "DELETE FROM cache WHERE key >= ? AND key < ?", self._namespace_range(namespace))
+
+    def count(self, namespace, now: float) -> int:
+        low, high = self._namespace_range(namespace)
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache WHERE key >= ? AND key < ? AND expires_at > ?",
+            (low, high, now)).fetchone()[0]
+
+
+class RedisBackend(SharedBackend):
+    """
+    Минимальный клиент протокола Redis (RESP2) на сокетах: GET, SET PX, DEL, SCAN.
+    Подходит и Redis, и совместимые серверы (KeyDB, Dragonfly, локальные заглушки).
+    У каждого потока свое соединение; после ошибки оно пересоздается.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url or "redis://127.0.0.1:6379/0")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.strip("/") or 0)
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CACHE_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile("rb")
+        if self.password is not None:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            self._execute(*auth)
+        if self.db:
+            self._execute("SELECT", self.db)
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                self._local.reader.close()
+                sock.close()
+            except OSError:
+                pass
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        out = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(out)
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Соединение с сервером кэша закрыто")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise CacheError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            size = int(payload)
+            if size < 0:
+                return None
+            data = self._local.reader.read(size + 2)
+            if len(data) != size + 2:
+                raise ConnectionError("Соединение с сервером кэша закрыто")
+            return data[:-2]
+        if kind == b"*":
+            size = int(payload)
+            return None if size < 0 else [self._read_reply() for _ in range(size)]
+        raise CacheError(f"Неизвестный ответ сервера кэша: {line!r}")
+
+    def _execute(self, *args):
+        self._local.sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def command(self, *args):
+        """Выполняет команду; при сетевой ошибке соединение закрывается и ошибка пробрасывается."""
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        try:
+            return self._execute(*args)
+        except (OSError, ValueError):
+            self._close()
+            raise
+
+    def _scan(self, namespace):
+        # Спецсимволы glob в префиксе экранируются
+        pattern = re.sub(r"([*?\[\]\\])", r"\\\1", self.namespace_prefix(namespace)) + "*"
+        cursor = b"0"
+        while True:
+            cursor, keys = self.command("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            yield keys
+            if cursor == b"0":
+                return
+
+    def get(self, namespace, key, now: float):
+        data = self.command("GET", self.make_key(namespace, key))
+        return None if data is None else self.loads(data)
+
+    def set(self, namespace, key, entry: tuple):
+        ttl_ms = math.ceil((entry[2] - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.command("SET", self.make_key(namespace, key), self.dumps(entry), "PX", ttl_ms)
+
+    def delete(self, namespace, key):
+        self.command("DEL", self.make_key(namespace, key))
+
+    def clear(self, namespace):
+        for keys in self._scan(namespace):
+            if keys:
+                self.command("DEL", *keys)
+
+    def count(self, namespace, now: float) -> int:
+        return sum(len(keys) for keys in self._scan(namespace))
+
+
+def _create_shared_backend():
+    if CACHE_BACKEND == "memory":
+        return None
+    if CACHE_BACKEND == "sqlite":
+        if CACHE_URL:
+            return SQLiteBackend(CACHE_URL)
+        # Каталог своего пользователя: файл не пересекается с кэшем других пользователей машины
+        shm = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        uid = _current_uid()
+        directory = os.path.join(shm, "trading-journal" if uid is None else f"trading-journal-{uid}")
+        return SQLiteBackend(os.path.join(directory, "cache.db"), private_dir=True)
+    if CACHE_BACKEND == "redis":
+        return RedisBackend(CACHE_URL)
+    raise ValueError(f"Неизвестный CACHE_BACKEND: {CACHE_BACKEND}")
+
+
+shared_backend = _create_shared_backend()
+
+
+class TTLCache:
+    """
+    Кэш с ограничением размера и временем жизни записей.
+
+    Запись считается свежей в течение ttl секунд после записи и устаревшей
+    еще stale_ttl секунд после этого: устаревшее значение можно отдать
+    клиенту, пока оно обновляется в фоне (stale-while-revalidate).
+    С private=True значения не покидают память процесса, а общее хранилище
+    (если оно есть) хранит только версии ключей для сброса во всех воркерах.
+    """
+
+    def __init__(self, namespace: str, ttl: float, maxsize: int = 1024, stale_ttl: float = 0,
+                 backend=None, private: bool = False):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        shared = backend or shared_backend
+        if private and shared is not None:
+            self._backend = MemoryBackend(maxsize)
+            self._versions = shared
+        else:
+            self._backend = shared or MemoryBackend(maxsize)
+            self._versions = None
+        # Обращается ли кэш к общему хранилищу (сеть или файл)
+        self.blocking = not isinstance(self._backend, MemoryBackend) or self._versions is not None
+
+    def _call(self, method, *args, default=None, namespace=None):
+        try:
+            return method(namespace or self.namespace, *args)
+        except Exception as e:
+            logger.warning(f"Ошибка кэша {self.namespace}: {e}")
+            return default
+
+    def _version(self, key, now: float):
+        """Текущая версия ключа в общем хранилище: None — ключ не сбрасывался; False — ошибка."""
+        entry = self._call(self._versions.get, key, now, default=False,
+                           namespace=f"{self.namespace}.version")
+        return entry[0] if entry else entry
+
+    def get_entry(self, key):
+        """
+        Возвращает кортеж (значение, свежее ли оно) или None, если записи нет
+        или она устарела сильнее, чем допускает stale_ttl.
+        """
+        now = time.time()
+        entry = self._call(self._backend.get, key, now)
+        if entry is None:
+            return None
+        value, fresh_until, _ = entry
+        if self._versions is not None:
+            version, value = value
+            if self._version(key, now) != version:
+                return None
+        return value, now < fresh_until
+
+    def get(self, key, default=None):
+        """Возвращает только свежее значение."""
+        entry = self.get_entry(key)
+        if entry is None or not entry[1]:
+            return default
+        return entry[0]
+
+    def set(self, key, value, ttl: float = None):
+        """Сохраняет значение; ttl задает время жизни этой записи вместо общего."""
+        now = time.time()
+        fresh_until = now + (self.ttl if ttl is None else ttl)
+        if self._versions is not None:
+            version = self._version(key, now)
+            if version is False:
+                return
+            value = (version, value)
+        self._call(self._backend.set, key, (value, fresh_until, fresh_until + self.stale_ttl))
+
+    def delete(self, key):
+        self._call(self._backend.delete, key)
+        if self._versions is not None:
+            # Новая версия живет дольше любой записи, созданной до сброса
+            expires_at = time.time() + self.ttl + self.stale_ttl
+            self._call(self._versions.set, key, (uuid.uuid4().hex, expires_at, expires_at),
+                       namespace=f"{self.namespace}.version")
+
+    def clear(self):
+        """Очищает кэш (для private=True — только в памяти этого процесса)."""
+        self._call(self._backend.clear)
+
+    def __len__(self):
+        return self._call(self._backend.count, time.time(), default=0)
+
+    async def aget_entry(self, key):
+        """get_entry для async-кода: обращение к общему хранилищу выполняется в пуле потоков."""
+        return await run_in_threadpool(self.get_entry, key) if self.blocking else self.get_entry(key)
+
+    async def aget(self, key, default=None):
+        return await run_in_threadpool(self.get, key, default) if self.blocking else self.get(key, default)
+
+    async def aset(self, key, value, ttl: float = None):
+        if self.blocking:
+            await run_in_threadpool(self.set, key, value, ttl)
+        else:
+            self.set(key, value, ttl)
+
+    async def adelete(self, key):
+        if self.blocking:
+            await run_in_threadpool(self.delete, key)
+        else:
+            self.delete(key)
+
+
+# Балансы бирж по ключу (user_id, exchange): JSON-ответы микросервисов
+balance_cache = TTLCache(
+    "balance",
+    ttl=float(os.getenv("BALANCE_CACHE_TTL", "30")),
+    maxsize=int(os.getenv("BALANCE_CACHE_SIZE", "10000")),
+    stale_ttl=float(os.getenv("BALANCE_CACHE_STALE", "300")),
+)
+
+# API-ключи пользователя по user_id: {биржа: колонки models.APIKey} (с секретами — только в памяти)
+credential_cache = TTLCache(
+    "credential",
+    ttl=float(os.getenv("CREDENTIAL_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("CREDENTIAL_CACHE_SIZE", "10000")),
+    private=True,
+)
+
+# Показатели портфеля по user_id (см. backend/analytics.py); сбрасываются при записи сделок
+analytics_cache = TTLCache(
+    "analytics",
+    ttl=float(os.getenv("ANALYTICS_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("ANALYTICS_CACHE_SIZE", "10000")),
+)
+
+# Цены активов по бирже-источнику: {биржа: {актив: цена}} (см. backend/valuation.py)
+ticker_cache = TTLCache(
+    "ticker",
+    ttl=float(os.getenv("TICKER_CACHE_TTL", "600")),
+    maxsize=64,
+)
+
+# Проверенные JWT по sha256 токена: имя пользователя из claim "sub".
+# Запись живет не дольше срока действия (exp) самого токена.
+token_cache = TTLCache(
+    "token",
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "3600")),
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+)
+
+# Ход текущего или результат последнего импорта сделок по user_id (см. backend/importer.py);
+# в общем хранилище отчет виден всем воркерам, а не только принявшему файл
+import_progress_cache = TTLCache(
+    "import-progress",
+    ttl=float(os.getenv("IMPORT_PROGRESS_TTL", "86400")),
+    maxsize=int(os.getenv("IMPORT_PROGRESS_SIZE", "10000")),
+)
+
+# Пользователи по username: колонки models.User (с хэшем пароля — только в памяти)
+user_cache = TTLCache(
+    "user",
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")),
+    private=True,
+)
@@ -1,9 +1,95 @@
-from sqlalchemy.orm import Session
+import base64
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, make_transient_to_detached
 import backend.models as models
+from backend.cache import analytics_cache, balance_cache, credential_cache, user_cache
+
+# Разрешения агрегатов капитала: функция округления времени до начала интервала
+EQUITY_RESOLUTIONS = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+# Сколько дней хранить сырые точки и агрегаты; 0 — хранить бессрочно
+EQUITY_RETENTION_DAYS = {
+    "raw": int(os.getenv("EQUITY_RAW_RETENTION_DAYS", "2")),
+    "minute": int(os.getenv("EQUITY_MINUTE_RETENTION_DAYS", "7")),
+    "hour": int(os.getenv("EQUITY_HOUR_RETENTION_DAYS", "180")),
+    "day": int(os.getenv("EQUITY_DAY_RETENTION_DAYS", "0")),
+}
+
+# Размер пачки для проверки уже сохраненных external_id (лимит параметров SQLite)
+_LOOKUP_CHUNK = 500
+
+# Диалекты с INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _upsert_user_exchange(db: Session, model, values: dict, update: tuple):
+    """
+    Вставляет строку (user_id, exchange) или обновляет колонки update у
+    существующей одним запросом по уникальному индексу (без commit).
+    Для диалектов без ON CONFLICT — UPDATE, а при отсутствии строки INSERT.
+    """
+    table = model.__table__
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.exchange],
+            set_={name: stmt.excluded[name] for name in update})
+        db.execute(stmt)
+        return
+    result = db.execute(table.update().where(
+        table.c.user_id == values["user_id"],
+        table.c.exchange == values["exchange"]
+    ).values({name: values[name] for name in update}))
+    if not result.rowcount:
+        db.execute(table.insert().values(**values))
+
+def row_data(row) -> dict:
+    """Значения колонок объекта модели: в кэшах хранятся они, а не объекты ORM."""
+    return {attr.key: getattr(row, attr.key) for attr in row.__mapper__.column_attrs}
+
+def detached_row(model, data: dict):
+    """Восстанавливает из row_data объект модели, отсоединенный от сессии."""
+    row = model(**data)
+    make_transient_to_detached(row)
+    return row
+
+def get_user(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
 
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
+def get_cached_user(db: Session, username: str):
+    """
+    Пользователь по username через user_cache. Возвращается объект,
+    отсоединенный от сессии: изменять его нужно через update_user.
+    """
+    data = user_cache.get(username)
+    if data is not None:
+        return detached_row(models.User, data)
+    user = get_user_by_username(db, username)
+    if user is None:
+        return None
+    user_cache.set(username, row_data(user))
+    db.expunge(user)
+    return user
+
+def update_user(db: Session, user_id: int, **fields):
+    """Обновляет поля пользователя и сбрасывает его запись в user_cache."""
+    user = get_user(db, user_id)
+    for name, value in fields.items():
+        setattr(user, name, value)
+    db.commit()
+    db.refresh(user)
+    user_cache.delete(user.username)
+    return user
+
 def create_user(db: Session, username: str, hashed_password: str, date_of_birth):
     """
     Создает пользователя с указанной датой рождения.
@@ -26,30 +112,26 @@ def create_user(db: Session, username: str, hashed_password: str, date_of_birth)
 def create_api_key(db: Session, user_id: int, exchange: str, api_key: str, secret_key: str, passphrase: str = None):
     """
     Создает или обновляет API-ключ для данного пользователя и биржи.
+    Сбрасывает закэшированные ключи пользователя, а также закэшированный
+    и сохраненный баланс и курсор синхронизации сделок этой биржи (они
+    получены со старыми ключами).
     """
-    existing = db.query(models.APIKey).filter(
-        models.APIKey.user_id == user_id,
-        models.APIKey.exchange == exchange
-    ).first()
-    if existing:
-        existing.api_key = api_key
-        existing.secret_key = secret_key
-        existing.passphrase = passphrase
-        db.commit()
-        db.refresh(existing)
-        return existing
-    else:
-        db_api_key = models.APIKey(
-            user_id=user_id, 
-            exchange=exchange, 
-            api_key=api_key, 
-            secret_key=secret_key,
-            passphrase=passphrase
-        )
-        db.add(db_api_key)
-        db.commit()
-        db.refresh(db_api_key)
-        return db_api_key
+    credential_cache.delete(user_id)
+    balance_cache.delete((user_id, exchange))
+    for model in (models.Balance, models.TradeSyncCheckpoint):
+        db.query(model).filter(
+            model.user_id == user_id,
+            model.exchange == exchange
+        ).delete(synchronize_session=False)
+    _upsert_user_exchange(db, models.APIKey, {
+        "user_id": user_id,
+        "exchange": exchange,
+        "api_key": api_key,
+        "secret_key": secret_key,
+        "passphrase": passphrase,
+    }, update=("api_key", "secret_key", "passphrase"))
+    db.commit()
+    return get_api_key(db, user_id, exchange)
 
 def get_api_key(db: Session, user_id: int, exchange: str):
     return db.query(models.APIKey).filter(
@@ -57,6 +139,20 @@ def get_api_key(db: Session, user_id: int, exchange: str):
         models.APIKey.exchange == exchange
     ).first()
 
+def get_api_keys(db: Session, user_id: int):
+    """
+    Возвращает все API-ключи пользователя одним запросом.
+    Результат кэшируется до следующего create_api_key для этого пользователя.
+    :return: Словарь {биржа: models.APIKey}.
+    """
+    data = credential_cache.get(user_id)
+    if data is None:
+        rows = db.query(models.APIKey).filter(models.APIKey.user_id == user_id).all()
+        data = {row.exchange: row_data(row) for row in rows}
+        credential_cache.set(user_id, data)
+    # Отсоединенные объекты можно читать после закрытия сессии
+    return {exchange: detached_row(models.APIKey, values) for exchange, values in data.items()}
+
 def create_balance(db: Session, user_id: int, exchange: str, balance: str):
     db_balance = models.Balance(user_id=user_id, exchange=exchange, balance=balance)
     db.add(db_balance)
@@ -67,19 +163,407 @@ def create_balance(db: Session, user_id: int, exchange: str, balance: str):
 def get_balances(db: Session):
     return db.query(models.Balance).all()
 
-def create_deal(db: Session, deal, profit: float):
+def get_user_balances(db: Session, user_id: int):
+    """
+    Возвращает сохраненные балансы пользователя.
+    :return: Словарь {биржа: models.Balance}.
+    """
+    rows = db.query(models.Balance).filter(models.Balance.user_id == user_id).all()
+    return {row.exchange: row for row in rows}
+
+def set_balance(db: Session, user_id: int, exchange: str, balance: str):
+    """
+    Создает или обновляет баланс пользователя на бирже одним запросом.
+    """
+    _upsert_user_exchange(db, models.Balance, {
+        "user_id": user_id,
+        "exchange": exchange,
+        "balance": balance,
+        "updated_at": datetime.utcnow(),
+    }, update=("balance", "updated_at"))
+    db.commit()
+
+def record_equity(db: Session, user_id: int, exchange: str, equity: float, ts: datetime = None):
+    """
+    Сохраняет точку капитала и обновляет минутный, часовой и дневной
+    агрегаты в той же транзакции. Агрегат обновляется одним INSERT ...
+    ON CONFLICT DO UPDATE, поэтому одновременные записи в один интервал не
+    сталкиваются на уникальном ключе.
+    """
+    ts = ts or datetime.utcnow()
+    db.add(models.EquitySnapshot(user_id=user_id, exchange=exchange, ts=ts, equity=equity))
+    table = models.EquityRollup.__table__
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    for resolution, truncate in EQUITY_RESOLUTIONS.items():
+        key = dict(user_id=user_id, resolution=resolution, bucket=truncate(ts), exchange=exchange)
+        if insert is not None:
+            stmt = insert(table).values(
+                open=equity, high=equity, low=equity, close=equity, samples=1, **key)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.resolution, table.c.bucket, table.c.exchange],
+                set_={
+                    "high": case((table.c.high < stmt.excluded.high, stmt.excluded.high), else_=table.c.high),
+                    "low": case((table.c.low > stmt.excluded.low, stmt.excluded.low), else_=table.c.low),
+                    "close": stmt.excluded.close,
+                    "samples": table.c.samples + 1,
+                }))
+            continue
+        result = db.execute(table.update().where(
+            *(table.c[name] == value for name, value in key.items())
+        ).values(
+            high=case((table.c.high < equity, equity), else_=table.c.high),
+            low=case((table.c.low > equity, equity), else_=table.c.low),
+            close=equity,
+            samples=table.c.samples + 1,
+        ))
+        if not result.rowcount:
+            db.execute(table.insert().values(
+                open=equity, high=equity, low=equity, close=equity, samples=1, **key))
+    db.commit()
+
+def prune_equity(db: Session, now: datetime = None):
+    """Удаляет сырые точки и агрегаты старше сроков из EQUITY_RETENTION_DAYS."""
+    now = now or datetime.utcnow()
+    days = EQUITY_RETENTION_DAYS["raw"]
+    if days:
+        db.query(models.EquitySnapshot).filter(
+            models.EquitySnapshot.ts < now - timedelta(days=days)
+        ).delete(synchronize_session=False)
+    for resolution in EQUITY_RESOLUTIONS:
+        days = EQUITY_RETENTION_DAYS[resolution]
+        if days:
+            db.query(models.EquityRollup).filter(
+                models.EquityRollup.resolution == resolution,
+                models.EquityRollup.bucket < now - timedelta(days=days)
+            ).delete(synchronize_session=False)
+    db.commit()
+
+def equity_series_select(user_id: int, resolution: str, since: datetime):
+    """
+    Запрос get_equity_series (общий для синхронной и асинхронной сессии):
+    закрытия интервалов по биржам с since, а также последний интервал
+    каждой биржи до since — от него значение переносится вперед.
+    """
+    rollup = models.EquityRollup
+    scope = (rollup.user_id == user_id, rollup.resolution == resolution)
+    previous = select(
+        rollup.exchange,
+        func.max(rollup.bucket).label("bucket")
+    ).where(*scope, rollup.bucket < since).group_by(rollup.exchange).subquery()
+    return select(rollup.bucket, rollup.exchange, rollup.close).where(
+        *scope,
+        rollup.bucket >= since
+    ).union_all(
+        select(rollup.bucket, rollup.exchange, rollup.close).join(
+            previous,
+            (rollup.exchange == previous.c.exchange) & (rollup.bucket == previous.c.bucket)
+        ).where(*scope)
+    ).order_by("bucket")
+
+def equity_series(rows, since: datetime):
+    """
+    Суммирует закрытия бирж по интервалам из строк equity_series_select.
+    Биржа без точки в интервале входит в сумму со своим последним закрытием,
+    иначе пропуск одного опроса выглядел бы на графике как провал капитала.
+    """
+    closes = {}
+    series = []
+    for bucket, exchange, close in rows:
+        closes[exchange] = close
+        if bucket < since:
+            continue
+        total = sum(closes.values())
+        if series and series[-1][0] == bucket:
+            series[-1] = (bucket, total)
+        else:
+            series.append((bucket, total))
+    return series
+
+def get_equity_series(db: Session, user_id: int, resolution: str, since: datetime):
+    """
+    Капитал пользователя по всем биржам на конец каждого интервала.
+    :return: Список пар (начало интервала, капитал) по возрастанию времени.
+    """
+    rows = db.execute(equity_series_select(user_id, resolution, since)).all()
+    return equity_series(rows, since)
+
+def get_user_ids_with_api_keys(db: Session):
+    """Возвращает ID всех пользователей, у которых сохранен хотя бы один API-ключ."""
+    rows = db.query(models.APIKey.user_id).distinct().all()
+    return [row.user_id for row in rows]
+
+# Счетчики trade_stats в порядке приращений _trade_stats_deltas
+_TRADE_STATS_COUNTERS = ("trade_count", "win_count", "loss_count", "gross_profit", "gross_loss")
+
+def _trade_stats_deltas(deals):
+    """
+    Сворачивает сделки в приращения статистики.
+    :param deals: Итерируемое из (user_id, platform, crypto_currency, profit).
+    :return: Словарь {(user_id, platform, crypto_currency): [сделки, прибыльные, убыточные, прибыль, убыток]};
+             ключ с пустыми platform и crypto_currency — итог по пользователю.
+    """
+    deltas = {}
+    for user_id, platform, crypto_currency, profit in deals:
+        profit = float(profit or 0)
+        for key in {(user_id, "", ""), (user_id, platform or "", crypto_currency or "")}:
+            delta = deltas.setdefault(key, [0, 0, 0, 0.0, 0.0])
+            delta[0] += 1
+            if profit > 0:
+                delta[1] += 1
+                delta[3] += profit
+            elif profit < 0:
+                delta[2] += 1
+                delta[4] -= profit
+    return deltas
+
+def _apply_trade_stats(db: Session, deltas: dict):
+    """
+    Добавляет приращения к строкам trade_stats (без commit).
+    Сложение выполняет сама база одним INSERT ... ON CONFLICT DO UPDATE на
+    ключ, поэтому одновременные записи (poller, /deals, импорт, /sync_trades)
+    не теряют приращений и не сталкиваются при создании строки.
+    """
+    table = models.TradeStats.__table__
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    now = datetime.utcnow()
+    # Единый порядок ключей: параллельные транзакции блокируют строки в одной последовательности
+    for (user_id, platform, crypto_currency), delta in sorted(deltas.items()):
+        counters = dict(zip(_TRADE_STATS_COUNTERS, delta))
+        if insert is not None:
+            stmt = insert(table).values(
+                user_id=user_id, platform=platform, crypto_currency=crypto_currency,
+                updated_at=now, **counters)
+            set_ = {name: table.c[name] + stmt.excluded[name] for name in _TRADE_STATS_COUNTERS}
+            set_["updated_at"] = stmt.excluded.updated_at
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.platform, table.c.crypto_currency],
+                set_=set_))
+            continue
+        set_ = {name: table.c[name] + value for name, value in counters.items()}
+        result = db.execute(table.update().where(
+            table.c.user_id == user_id,
+            table.c.platform == platform,
+            table.c.crypto_currency == crypto_currency
+        ).values(updated_at=now, **set_))
+        if not result.rowcount:
+            db.execute(table.insert().values(
+                user_id=user_id, platform=platform, crypto_currency=crypto_currency,
+                updated_at=now, **counters))
+
+def apply_deals_to_stats(db: Session, deals):
+    """
+    Добавляет в trade_stats пачку сделок (без commit).
+    :param deals: Словари значений models.Deal с user_id, platform, crypto_currency и profit.
+    """
+    _apply_trade_stats(db, _trade_stats_deltas(
+        (d["user_id"], d["platform"], d["crypto_currency"], d["profit"])
+        for d in deals if d.get("user_id") is not None))
+
+def calculate_profit(quantity_bought: float, quantity_sold: float, exchange_rate: float) -> float:
+    return (quantity_sold - quantity_bought) * exchange_rate
+
+def create_deal(db: Session, deal, profit: float, user_id: int = None):
+    """
+    Сохраняет сделку и в той же транзакции обновляет статистику пользователя.
+    """
     db_deal = models.Deal(
         full_name=deal.full_name,
         password=deal.password,
         api_key=deal.api_key,
         platform=deal.platform,
         crypto_currency=deal.crypto_currency,
-        quantity_bought=str(deal.quantity_bought),
-        quantity_sold=str(deal.quantity_sold),
-        exchange_rate=str(deal.exchange_rate),
-        profit=str(profit)
+        quantity_bought=deal.quantity_bought,
+        quantity_sold=deal.quantity_sold,
+        exchange_rate=deal.exchange_rate,
+        profit=profit,
+        user_id=user_id,
+        executed_at=getattr(deal, "executed_at", None) or datetime.utcnow()
     )
     db.add(db_deal)
+    if user_id is not None:
+        analytics_cache.delete(user_id)
+        _apply_trade_stats(db, _trade_stats_deltas(
+            [(user_id, deal.platform, deal.crypto_currency, profit)]))
     db.commit()
     db.refresh(db_deal)
     return db_deal
+
+def _existing_external_ids(db: Session, user_id: int, external_ids: list) -> set:
+    existing = set()
+    for i in range(0, len(external_ids), _LOOKUP_CHUNK):
+        chunk = external_ids[i:i + _LOOKUP_CHUNK]
+        rows = db.query(models.Deal.external_id).filter(
+            models.Deal.user_id == user_id,
+            models.Deal.external_id.in_(chunk)
+        ).all()
+        existing.update(row.external_id for row in rows)
+    return existing
+
+def insert_new_deals(db: Session, user_id: int, rows: list) -> int:
+    """
+    Вставляет пачку сделок пользователя, пропуская уже сохраненные
+    external_id, и обновляет trade_stats (без commit).
+    :param rows: Словари значений models.Deal с заполненным external_id.
+    :return: Число вставленных сделок.
+    """
+    existing = _existing_external_ids(db, user_id, [values["external_id"] for values in rows])
+    new_rows = []
+    for values in rows:
+        if values["external_id"] not in existing:
+            # Повтор внутри самой пачки тоже считается дублем
+            existing.add(values["external_id"])
+            new_rows.append(values)
+    if new_rows:
+        db.execute(models.Deal.__table__.insert(), new_rows)
+        apply_deals_to_stats(db, new_rows)
+        analytics_cache.delete(user_id)
+    return len(new_rows)
+
+def get_trade_checkpoints(db: Session, user_id: int):
+    """Возвращает курсоры синхронизации сделок пользователя в виде {биржа: TradeSyncCheckpoint}."""
+    rows = db.query(models.TradeSyncCheckpoint).filter(
+        models.TradeSyncCheckpoint.user_id == user_id
+    ).all()
+    return {row.exchange: row for row in rows}
+
+def set_trade_checkpoint(db: Session, user_id: int, exchange: str, cursor: str, inserted: int):
+    """Сохраняет курсор синхронизации сделок (без commit)."""
+    checkpoint = db.query(models.TradeSyncCheckpoint).filter(
+        models.TradeSyncCheckpoint.user_id == user_id,
+        models.TradeSyncCheckpoint.exchange == exchange
+    ).first()
+    if not checkpoint:
+        checkpoint = models.TradeSyncCheckpoint(user_id=user_id, exchange=exchange)
+        db.add(checkpoint)
+    checkpoint.cursor = cursor
+    checkpoint.synced_at = datetime.utcnow()
+    checkpoint.last_inserted = inserted
+    return checkpoint
+
+def set_deal_snapshot(db: Session, user_id: int, max_id: int, executed_at: bytes, profit: bytes):
+    """Сохраняет массивы сделок пользователя для аналитики (без commit)."""
+    table = models.DealSnapshot.__table__
+    values = dict(user_id=user_id, max_id=max_id, executed_at=executed_at, profit=profit,
+                  updated_at=datetime.utcnow())
+    insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(**values)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={name: stmt.excluded[name] for name in values if name != "user_id"}))
+        return
+    result = db.execute(table.update().where(table.c.user_id == user_id).values(**values))
+    if not result.rowcount:
+        db.execute(table.insert().values(**values))
+
+def get_trade_stats(db: Session, user_id: int, platform: str = "", crypto_currency: str = ""):
+    """
+    Возвращает строку статистики пользователя (по умолчанию — итоговую) или None.
+    """
+    return db.query(models.TradeStats).filter(
+        models.TradeStats.user_id == user_id,
+        models.TradeStats.platform == platform,
+        models.TradeStats.crypto_currency == crypto_currency
+    ).first()
+
+def rebuild_trade_stats(db: Session, user_id: int = None):
+    """
+    Пересчитывает trade_stats с нуля по таблице сделок одним агрегирующим
+    запросом. Без user_id пересчитываются все пользователи.
+    :return: Число записанных строк статистики.
+    """
+    profit = models.Deal.profit
+    query = db.query(
+        models.Deal.user_id,
+        models.Deal.platform,
+        models.Deal.crypto_currency,
+        func.count(models.Deal.id),
+        func.sum(case((profit > 0, 1), else_=0)),
+        func.sum(case((profit < 0, 1), else_=0)),
+        func.sum(case((profit > 0, profit), else_=0)),
+        func.sum(case((profit < 0, -profit), else_=0))
+    ).filter(models.Deal.user_id.isnot(None))
+    stats_query = db.query(models.TradeStats)
+    if user_id is not None:
+        query = query.filter(models.Deal.user_id == user_id)
+        stats_query = stats_query.filter(models.TradeStats.user_id == user_id)
+    rows = query.group_by(
+        models.Deal.user_id, models.Deal.platform, models.Deal.crypto_currency).all()
+
+    stats_query.delete(synchronize_session=False)
+    totals = {}
+    for owner, platform, crypto_currency, *values in rows:
+        for key in {(owner, "", ""), (owner, platform or "", crypto_currency or "")}:
+            total = totals.setdefault(key, [0.0] * 5)
+            for i, value in enumerate(values):
+                total[i] += float(value or 0)
+    now = datetime.utcnow()
+    for (owner, platform, crypto_currency), (trades, wins, losses, gross_profit, gross_loss) in totals.items():
+        db.add(models.TradeStats(
+            user_id=owner,
+            platform=platform,
+            crypto_currency=crypto_currency,
+            trade_count=int(trades),
+            win_count=int(wins),
+            loss_count=int(losses),
+            gross_profit=gross_profit,
+            gross_loss=gross_loss,
+            updated_at=now
+        ))
+    db.commit()
+    return len(totals)
+
+def encode_trade_cursor(executed_at: datetime, deal_id: int) -> str:
+    """Курсор постраничной истории сделок: позиция последней отданной сделки."""
+    raw = f"{executed_at.isoformat()}|{deal_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_trade_cursor(cursor: str):
+    """
+    Разбирает курсор encode_trade_cursor.
+    :return: Пара (executed_at, id).
+    :raises ValueError: Если курсор поврежден.
+    """
+    try:
+        executed_at, deal_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(executed_at), int(deal_id)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Некорректный курсор: {cursor}") from e
+
+def trades_page_select(user_id: int, limit: int, cursor: str = None,
+                       platform: str = None, crypto_currency: str = None):
+    """
+    Запрос страницы истории сделок: на одну строку больше limit, чтобы
+    узнать, есть ли следующая страница (см. split_trades_page).
+    :raises ValueError: Если курсор поврежден.
+    """
+    stmt = select(models.Deal).where(models.Deal.user_id == user_id)
+    if platform:
+        stmt = stmt.where(models.Deal.platform == platform)
+    if crypto_currency:
+        stmt = stmt.where(models.Deal.crypto_currency == crypto_currency)
+    if cursor:
+        stmt = stmt.where(
+            tuple_(models.Deal.executed_at, models.Deal.id) < decode_trade_cursor(cursor))
+    return stmt.order_by(
+        models.Deal.executed_at.desc(), models.Deal.id.desc()
+    ).limit(limit + 1)
+
+def split_trades_page(rows: list, limit: int):
+    """Отрезает лишнюю строку trades_page_select и строит курсор следующей страницы."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_trade_cursor(rows[-1].executed_at, rows[-1].id)
+    return rows, next_cursor
+
+def get_trades_page(db: Session, user_id: int, limit: int = 50, cursor: str = None,
+                    platform: str = None, crypto_currency: str = None):
+    """
+    Страница истории сделок пользователя от новых к старым.
+    Использует keyset-пагинацию по индексу (user_id, executed_at, id), поэтому
+    любая страница стоит столько же, сколько первая.
+    :return: Пара (список models.Deal, курсор следующей страницы или None).
+    """
+    stmt = trades_page_select(user_id, limit, cursor, platform, crypto_currency)
+    return split_trades_page(db.execute(stmt).scalars().all(), limit)
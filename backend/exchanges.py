@@ -0,0 +1,298 @@
+"""
+Запросы балансов к микросервисам бирж.
+
+Каждая биржа описана в EXCHANGES: нужен ли passphrase и функция, приводящая
+ответ сервиса к строке для дашборда. Адреса сервисов и HTTP-клиент
+находятся в backend.services.
+iter_balances() опрашивает все биржи пользователя одновременно и отдает
+балансы по мере готовности, у каждой биржи свой дедлайн; не успевшие
+ответить помечаются как TIMED_OUT.
+Успешные ответы (JSON микросервиса) кэшируются в cache.balance_cache
+по (user_id, биржа).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import backend.services as services
+from backend.cache import balance_cache
+
+logger = logging.getLogger(__name__)
+
+NO_DATA = "Нет данных"
+FETCH_ERROR = "Ошибка получения данных"
+TIMED_OUT = "Превышено время ожидания"
+
+# Дедлайн по умолчанию (сек.) для одной биржи; переопределяется через
+# переменные окружения вида BITGET_TIMEOUT, BINANCE_TIMEOUT и т.д.
+EXCHANGE_TIMEOUT = float(os.getenv("EXCHANGE_TIMEOUT", "5"))
+# Общий пул потоков для запросов ко всем биржам всех пользователей
+FETCH_WORKERS = int(os.getenv("EXCHANGE_FETCH_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=FETCH_WORKERS, thread_name_prefix="exchange-fetch")
+
+# Ключи (user_id, биржа), для которых уже идет фоновое обновление кэша
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _format_bitget(data):
+    if isinstance(data, dict) and "balance" in data:
+        return f"{data['balance']}"
+    return NO_DATA
+
+
+def _format_binance(data):
+    if isinstance(data, dict) and "USDT" in data and float(data["USDT"]) > 0:
+        return f"{data['USDT']} USDT"
+    assets = {k: v for k, v in data.items() if float(v) > 0} if isinstance(data, dict) else {}
+    return assets if assets else NO_DATA
+
+
+def _format_kraken(data):
+    if isinstance(data, dict) and "result" in data:
+        return f"{data.get('result', {}).get('XXBTZUSD', NO_DATA)}"
+    return NO_DATA
+
+
+def _format_kucoin(data):
+    if isinstance(data, list):
+        accounts = [f"{acc.get('currency')}: {acc.get('balance')}"
+                    for acc in data if float(acc.get('balance', 0)) > 0]
+        return " , ".join(accounts) if accounts else NO_DATA
+    return NO_DATA
+
+
+def _format_cbpro(data):
+    if isinstance(data, dict) and "balance" in data:
+        return f"{data['balance']}"
+    return NO_DATA
+
+
+def _format_mexc(data):
+    if isinstance(data, dict) and "data" in data:
+        return f"{data['data'].get('balance', NO_DATA)}"
+    return NO_DATA
+
+
+def _holdings_bitget(data):
+    # Фьючерсные счета Bitget: капитал уже пересчитан в USDT
+    return {"USDT": sum(float(item.get("usdtEquity") or 0) for item in data)}
+
+
+def _holdings_binance(data):
+    return {asset: float(amount) for asset, amount in data.items()}
+
+
+def _holdings_kraken(data):
+    return {asset: float(amount) for asset, amount in data.get("result", {}).items()}
+
+
+def _holdings_kucoin(data):
+    holdings = {}
+    for acc in data:
+        currency = acc.get("currency")
+        holdings[currency] = holdings.get(currency, 0.0) + float(acc.get("balance", 0))
+    return holdings
+
+
+def _holdings_cbpro(data):
+    return {currency: float(amount) for currency, amount in data.items()}
+
+
+def _holdings_mexc(data):
+    return {
+        asset: float(item.get("available") or 0) + float(item.get("frozen") or 0)
+        for asset, item in data.get("data", {}).items()
+    }
+
+
+# Порядок словаря задает порядок вывода бирж на дашборде
+EXCHANGES = {
+    "bitget": {
+        "title": "Bitget",
+        "passphrase": True,
+        "format": _format_bitget,
+        "holdings": _holdings_bitget,
+    },
+    "binance": {
+        "title": "Binance",
+        "passphrase": False,
+        "format": _format_binance,
+        "holdings": _holdings_binance,
+    },
+    "kraken": {
+        "title": "Kraken",
+        "passphrase": False,
+        "format": _format_kraken,
+        "holdings": _holdings_kraken,
+    },
+    "kucoin": {
+        "title": "Kucoin",
+        "passphrase": True,
+        "format": _format_kucoin,
+        "holdings": _holdings_kucoin,
+    },
+    "cbpro": {
+        "title": "CBPro",
+        "passphrase": True,
+        "format": _format_cbpro,
+        "holdings": _holdings_cbpro,
+    },
+    "mexc": {
+        "title": "Mexc",
+        "passphrase": False,
+        "format": _format_mexc,
+        "holdings": _holdings_mexc,
+    },
+}
+
+
+def get_timeout(exchange: str) -> float:
+    """Дедлайн (сек.) на получение баланса с указанной биржи."""
+    value = os.getenv(f"{exchange.upper()}_TIMEOUT")
+    return float(value) if value else EXCHANGE_TIMEOUT
+
+
+def build_params(exchange: str, key, token: str = None) -> dict:
+    """
+    Собирает query-параметры запроса к микросервису биржи.
+    Вызывается в потоке запроса, чтобы не обращаться к ORM-объекту из пула.
+    """
+    params = {
+        "token": token,
+        "api_key": key.api_key,
+        "secret_key": key.secret_key,
+    }
+    if EXCHANGES[exchange]["passphrase"]:
+        params["passphrase"] = key.passphrase
+    return params
+
+
+def fetch_balance(exchange: str, params: dict):
+    """
+    Запрашивает баланс у микросервиса биржи и возвращает его JSON-ответ.
+    Исключения сетевого уровня пробрасываются наружу.
+    """
+    resp = services.get(exchange, "/get_balance", params=params,
+                        read_timeout=get_timeout(exchange))
+    resp.raise_for_status()
+    return resp.json()
+
+
+def format_balance(exchange: str, data):
+    """Приводит JSON-ответ микросервиса биржи к значению для дашборда."""
+    try:
+        return EXCHANGES[exchange]["format"](data)
+    except (TypeError, ValueError, AttributeError):
+        return FETCH_ERROR
+
+
+def format_stored_balance(exchange: str, balance: str):
+    """Форматирует значение колонки models.Balance.balance (JSON-строка)."""
+    try:
+        data = json.loads(balance)
+    except (TypeError, ValueError):
+        return balance or NO_DATA
+    return format_balance(exchange, data)
+
+
+def get_holdings(exchange: str, data) -> dict:
+    """
+    Приводит JSON-ответ микросервиса биржи к словарю {актив: количество}.
+    Нераспознанный ответ дает пустой словарь.
+    """
+    try:
+        holdings = EXCHANGES[exchange]["holdings"](data)
+    except (TypeError, ValueError, AttributeError):
+        return {}
+    return {asset: amount for asset, amount in holdings.items() if asset and amount}
+
+
+def _fetch_and_store(user_id, exchange: str, params: dict):
+    """Запрашивает баланс и сохраняет успешный ответ в кэш."""
+    data = fetch_balance(exchange, params)
+    balance_cache.set((user_id, exchange), data)
+    return data
+
+
+def _refresh_in_background(user_id, exchange: str, params: dict):
+    """Обновляет устаревшую запись кэша, не более одного обновления на ключ."""
+    cache_key = (user_id, exchange)
+    with _refreshing_lock:
+        if cache_key in _refreshing:
+            return
+        _refreshing.add(cache_key)
+
+    def refresh():
+        try:
+            _fetch_and_store(user_id, exchange, params)
+        except Exception as e:
+            logger.error(f"Ошибка фонового обновления баланса {EXCHANGES[exchange]['title']}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(cache_key)
+
+    _executor.submit(refresh)
+
+
+def iter_balances(keys: dict, token: str = None, user_id: int = None):
+    """
+    Одновременно запрашивает балансы всех бирж, для которых есть API-ключи,
+    и отдает пары (биржа, значение) по мере готовности.
+
+    Свежие значения берутся из кэша без сетевых запросов и отдаются первыми;
+    устаревшие отдаются сразу и обновляются в фоне.
+
+    :param keys: Словарь {биржа: models.APIKey}.
+    :param token: JWT пользователя (передается микросервисам как есть).
+    :param user_id: ID пользователя для кэша; None отключает кэширование.
+    :return: Генератор пар (биржа, значение); для бирж, не уложившихся в свой
+             дедлайн, значение равно TIMED_OUT.
+    """
+    started = time.monotonic()
+    pending = {}
+    for name in EXCHANGES:
+        if name not in keys:
+            continue
+        params = build_params(name, keys[name], token)
+        entry = balance_cache.get_entry((user_id, name)) if user_id is not None else None
+        if entry is not None:
+            data, fresh = entry
+            if not fresh:
+                _refresh_in_background(user_id, name, params)
+            yield name, format_balance(name, data)
+        elif user_id is not None:
+            pending[_executor.submit(_fetch_and_store, user_id, name, params)] = name
+        else:
+            pending[_executor.submit(fetch_balance, name, params)] = name
+
+    deadlines = {future: started + get_timeout(name) for future, name in pending.items()}
+    while pending:
+        timeout = max(min(deadlines[f] for f in pending) - time.monotonic(), 0)
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                yield name, format_balance(name, future.result())
+            except Exception as e:
+                logger.error(f"Ошибка запроса баланса {EXCHANGES[name]['title']}: {e}")
+                yield name, FETCH_ERROR
+        now = time.monotonic()
+        for future in [f for f in pending if deadlines[f] <= now]:
+            name = pending.pop(future)
+            logger.warning(f"Превышено время ожидания баланса {EXCHANGES[name]['title']}")
+            yield name, TIMED_OUT
+
+
+def fetch_balances(keys: dict, token: str = None, user_id: int = None) -> dict:
+    """
+    Собирает все балансы iter_balances() в словарь {биржа: значение}
+    в порядке EXCHANGES.
+    """
+    results = dict(iter_balances(keys, token, user_id))
+    return {name: results[name] for name in EXCHANGES if name in results}
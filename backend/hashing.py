@@ -0,0 +1,91 @@
+"""
+Хэширование паролей в отдельном пуле процессов.
+
+bcrypt намеренно медленный, поэтому хэширование и проверка паролей при
+входе и регистрации выполняются не в общем пуле потоков FastAPI (где
+работают и запросы к биржам), а в пуле из PASSWORD_HASH_WORKERS процессов.
+Одновременно принимается не больше PASSWORD_HASH_QUEUE операций; сверх
+этого вызывающий получает HashingBusy (эндпоинты отвечают 503 с
+заголовком Retry-After).
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# Стоимость bcrypt (log2 числа раундов); хэши с другой стоимостью пересчитываются при входе
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Максимум операций в работе и в очереди пула
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", str(PASSWORD_HASH_WORKERS * 8)))
+# Через сколько секунд клиенту предлагается повторить запрос при перегрузке
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class HashingBusy(Exception):
+    """Очередь пула хэширования заполнена."""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str):
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS,
+                 queue_limit: int = PASSWORD_HASH_QUEUE):
+        self._workers = workers
+        self._queue_limit = queue_limit
+        self._pool = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork процесса с потоками (poller, пулы запросов) небезопасен
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def _run(self, func, *args):
+        with self._lock:
+            if self._inflight >= self._queue_limit:
+                raise HashingBusy()
+            self._inflight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), func, *args)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """
+        Проверяет пароль.
+        :return: Пара (совпал ли пароль, новый хэш или None, если пересчет не нужен).
+        """
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
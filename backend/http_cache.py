@@ -0,0 +1,199 @@
+"""
+HTTP-кэширование и сжатие ответов.
+
+HTTPCacheMiddleware проставляет Cache-Control по таблице политик маршрутов
+и для маршрутов с ETag добавляет к ответам GET сильный ETag (хэш тела,
+если обработчик не задал его сам). Запрос с совпадающим If-None-Match
+получает 304 без тела.
+CompressionMiddleware сжимает ответы не меньше COMPRESSION_MIN_SIZE байт
+алгоритмом brotli (если установлен пакет brotli и клиент его принимает)
+или gzip. Потоковые ответы (SSE) не сжимаются. ETag сжатого ответа
+получает суффикс кодировки ("<хэш>-br"), чтобы разные представления не
+имели одинаковый сильный ETag; при сравнении суффикс отбрасывается.
+"""
+import gzip
+import hashlib
+import os
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Ответы меньше этого размера (байт) не сжимаются
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+# Качество brotli 0-11: высокие значения слишком медленны для динамических страниц
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+# Политики Cache-Control
+PUBLIC_PAGE_CACHE_CONTROL = os.getenv("PUBLIC_PAGE_CACHE_CONTROL", "public, max-age=300")
+PRIVATE_PAGE_CACHE_CONTROL = os.getenv("PRIVATE_PAGE_CACHE_CONTROL", "no-store")
+API_CACHE_CONTROL = os.getenv("API_CACHE_CONTROL", "private, no-cache")
+
+# Типы содержимого, которые имеет смысл сжимать
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому тела."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _strip_etag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Совпадает ли ETag ответа с одним из ETag заголовка If-None-Match."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    etag = _strip_etag(etag)
+    return any(_strip_etag(tag) == etag for tag in if_none_match.split(","))
+
+
+class HTTPCacheMiddleware:
+    """
+    :param policies: Словарь {путь: (Cache-Control или None, добавлять ли ETag)}.
+    """
+
+    def __init__(self, app, policies: dict):
+        self.app = app
+        self.policies = policies
+
+    async def __call__(self, scope, receive, send):
+        policy = self.policies.get(scope["path"]) if scope["type"] == "http" else None
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+        cache_control, use_etag = policy
+        # HEAD отдается без тела, по которому считается ETag
+        use_etag = use_etag and scope["method"] == "GET"
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if cache_control and "cache-control" not in headers:
+                    headers["Cache-Control"] = cache_control
+                if not use_etag or message["status"] != 200:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            passthrough = True
+            headers = MutableHeaders(scope=start)
+            if message.get("more_body", False):
+                # Потоковый ответ: тело целиком не известно, ETag не ставится
+                await send(start)
+                await send(message)
+                return
+            etag = headers.get("etag")
+            if etag is None:
+                etag = make_etag(message.get("body", b""))
+                headers["ETag"] = etag
+            if etag_matches(if_none_match, etag):
+                start["status"] = 304
+                for name in ("content-length", "content-type"):
+                    del headers[name]
+                await send(start)
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _accepted_encoding(accept_encoding: str):
+    """Лучшая из поддерживаемых кодировок, которую принимает клиент (br, gzip или None)."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            passthrough = True
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or "content-encoding" in headers
+                    or not _is_compressible(headers.get("content-type", ""))
+                    or len(body) < self.minimum_size):
+                await send(start)
+                await send(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None:
+                body = _compress(body, encoding)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                etag = headers.get("etag")
+                if etag and etag.endswith('"') and not etag.startswith("W/"):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                message = {"type": "http.response.body", "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,177 @@
+"""
+Потоковый импорт сделок из выгрузок бирж (CSV или JSONL).
+
+Файл читается построчно и никогда не загружается в память целиком; каждая
+строка проверяется через schemas.DealCreate, а сделки записываются пачками
+по IMPORT_BATCH_SIZE в одной транзакции вместе с обновлением trade_stats.
+
+Повторный импорт того же файла не создает дублей: каждой сделке
+присваивается external_id — идентификатор сделки биржи из колонки
+trade_id/id, а если его нет, хэш содержимого строки с номером повторения
+такой же строки в файле.
+"""
+import codecs
+import csv
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+import backend.crud as crud
+import backend.schemas as schemas
+from backend.cache import import_progress_cache
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Сколько ошибок строк возвращать в отчете (остальные только считаются)
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+# Как часто (сек.) публиковать ход импорта в import_progress_cache
+IMPORT_PROGRESS_INTERVAL = float(os.getenv("IMPORT_PROGRESS_INTERVAL", "1"))
+
+JSONL_EXTENSIONS = (".jsonl", ".ndjson", ".json")
+EXTERNAL_ID_COLUMNS = ("external_id", "trade_id", "id")
+
+def get_progress(user_id: int):
+    """
+    Возвращает отчет о последнем (или текущем) импорте пользователя из
+    import_progress_cache — из любого воркера, если кэш общий.
+    """
+    return import_progress_cache.get(user_id)
+
+
+def iter_rows(binary_file, filename: str = ""):
+    """
+    Построчно читает CSV или JSONL (по расширению файла).
+    :return: Генератор пар (номер строки, словарь значений или исключение разбора).
+    """
+    lines = codecs.iterdecode(binary_file, "utf-8-sig")
+    if (filename or "").lower().endswith(JSONL_EXTENSIONS):
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+    else:
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _external_id(row: dict, deal: schemas.DealCreate, seen: dict) -> str:
+    for column in EXTERNAL_ID_COLUMNS:
+        value = row.get(column)
+        if value not in (None, ""):
+            return f"{deal.platform}:{value}"
+    content = "|".join(str(v) for v in (
+        deal.platform, deal.crypto_currency, deal.quantity_bought,
+        deal.quantity_sold, deal.exchange_rate, deal.executed_at, row.get("profit")))
+    digest = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    # Одинаковые сделки внутри файла различаются номером повторения
+    seen[digest] = seen.get(digest, 0) + 1
+    return f"row:{digest}:{seen[digest]}"
+
+
+def _parse_row(row, user, seen: dict) -> dict:
+    """Проверяет строку выгрузки и превращает ее в значения для models.Deal."""
+    if isinstance(row, Exception):
+        raise ValueError(f"Некорректная строка: {row}")
+    if not isinstance(row, dict):
+        raise ValueError("Строка должна быть объектом")
+    deal = schemas.DealCreate(
+        full_name=row.get("full_name") or user.username,
+        password=row.get("password") or "",
+        api_key=row.get("api_key") or "",
+        platform=row.get("platform"),
+        crypto_currency=row.get("crypto_currency"),
+        quantity_bought=row.get("quantity_bought"),
+        quantity_sold=row.get("quantity_sold"),
+        exchange_rate=row.get("exchange_rate"),
+        executed_at=row.get("executed_at") or None,
+    )
+    profit = row.get("profit")
+    if profit in (None, ""):
+        profit = crud.calculate_profit(deal.quantity_bought, deal.quantity_sold, deal.exchange_rate)
+    values = deal.model_dump()
+    values.update(
+        executed_at=deal.executed_at or datetime.utcnow(),
+        profit=float(profit),
+        user_id=user.id,
+        external_id=_external_id(row, deal, seen),
+    )
+    return values
+
+
+def _flush_batch(db: Session, user_id: int, batch: list) -> int:
+    """Записывает пачку сделок без уже импортированных; возвращает число вставленных."""
+    inserted = crud.insert_new_deals(db, user_id, batch)
+    db.commit()
+    return inserted
+
+
+def import_deals(db: Session, user, binary_file, filename: str = "") -> dict:
+    """
+    Импортирует сделки пользователя из файла выгрузки.
+    :param binary_file: Файловый объект в бинарном режиме (например, UploadFile.file).
+    :return: Отчет: processed, inserted, duplicates, failed, errors и status.
+    """
+    report = {
+        "filename": filename,
+        "status": "running",
+        "processed": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "failed": 0,
+        "errors": [],
+    }
+    published = [0.0]
+
+    def update(final: bool = False, **changes):
+        # Отчет публикуется не чаще IMPORT_PROGRESS_INTERVAL: ошибка в каждой
+        # строке не должна означать запись в общий кэш на каждую строку
+        report.update(changes)
+        now = time.monotonic()
+        if final or now - published[0] >= IMPORT_PROGRESS_INTERVAL:
+            published[0] = now
+            import_progress_cache.set(user.id, dict(report))
+
+    update()
+
+    seen = {}
+    batch = []
+    try:
+        for line_no, row in iter_rows(binary_file, filename):
+            try:
+                batch.append(_parse_row(row, user, seen))
+            except (ValidationError, ValueError, TypeError) as e:
+                errors = report["errors"]
+                if len(errors) < IMPORT_MAX_ERRORS:
+                    errors = errors + [{"line": line_no, "error": str(e)}]
+                update(failed=report["failed"] + 1, errors=errors,
+                       processed=report["processed"] + 1)
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                inserted = _flush_batch(db, user.id, batch)
+                update(processed=report["processed"] + len(batch),
+                       inserted=report["inserted"] + inserted,
+                       duplicates=report["duplicates"] + len(batch) - inserted)
+                logger.info(f"Импорт сделок пользователя {user.id}: обработано {report['processed']} строк")
+                batch = []
+        if batch:
+            inserted = _flush_batch(db, user.id, batch)
+            update(processed=report["processed"] + len(batch),
+                   inserted=report["inserted"] + inserted,
+                   duplicates=report["duplicates"] + len(batch) - inserted)
+        update(final=True, status="done")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Ошибка импорта сделок пользователя {user.id}: {e}")
+        update(final=True, status="error", error=str(e))
+    return dict(report)
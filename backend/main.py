@@ -1,31 +1,119 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Depends, HTTPException, status, Form, Request, Query, File, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordRequestForm
+from contextlib import asynccontextmanager
 from typing import Optional
 import os
-import requests
+import json
 import logging
+import stat
 from dotenv import load_dotenv
-from datetime import datetime, date
+from jinja2 import FileSystemBytecodeCache
+from datetime import datetime, date, timedelta
 
-from backend.database import SessionLocal, engine
-import backend.models as models
+from backend.database import AsyncSessionLocal, SessionLocal, engine
 import backend.schemas as schemas
 import backend.crud as crud
+import backend.async_crud as async_crud
 import backend.auth as auth
+import backend.exchanges as exchanges
+import backend.analytics as analytics
+import backend.importer as importer
+import backend.trade_sync as trade_sync
+from backend.bootstrap import acquire_leader_lock, prepare_database, SEED_ADMIN
+from backend.poller import balance_poller, BALANCE_POLL_ENABLED
+import backend.valuation as valuation
+from backend.cache import shared_backend
+from backend.hashing import HashingBusy, password_hasher, PASSWORD_HASH_RETRY_AFTER
+from backend.http_cache import (
+    API_CACHE_CONTROL, PRIVATE_PAGE_CACHE_CONTROL, PUBLIC_PAGE_CACHE_CONTROL,
+    CompressionMiddleware, HTTPCacheMiddleware, make_etag,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Trading Journal App")
+# Создавать ли мастер-админа при запуске (SEED_ADMIN=0 или python -m backend.main --skip-seed)
+seed_on_startup = SEED_ADMIN
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Схема и админ — один раз за запуск процесса, под межпроцессной блокировкой
+    await run_in_threadpool(prepare_database, engine, seed_on_startup)
+    load_templates()
+    # Балансы опрашивает только ведущий воркер: иначе каждая биржа опрашивалась
+    # бы N раз за интервал, а история капитала писалась бы N раз
+    leader = None
+    if BALANCE_POLL_ENABLED or valuation.TICKER_REFRESH_ENABLED:
+        leader = acquire_leader_lock()
+        if leader is None:
+            logger.info("Фоновые задачи выполняет другой процесс")
+    # Цены из общего хранилища видны всем воркерам; кэш в памяти каждый воркер обновляет сам
+    if valuation.TICKER_REFRESH_ENABLED and (leader is not None or shared_backend is None):
+        valuation.ticker_refresher.start()
+    if BALANCE_POLL_ENABLED and leader is not None:
+        balance_poller.start()
+    try:
+        yield
+    finally:
+        balance_poller.stop()
+        valuation.ticker_refresher.stop()
+        if leader is not None:
+            leader.close()
+        password_hasher.shutdown()
+
+
+app = FastAPI(title="Trading Journal App", lifespan=lifespan)
+
+# Политики HTTP-кэширования: {путь: (Cache-Control, добавлять ли ETag)}.
+# Страницы без токена одинаковы для всех и кэшируются публично; страницы
+# с токеном в адресе не сохраняются; JSON API перепроверяется по ETag.
+HTTP_CACHE_POLICIES = {
+    "/": (PUBLIC_PAGE_CACHE_CONTROL, True),
+    "/login_form": (PUBLIC_PAGE_CACHE_CONTROL, True),
+    "/register_form": (PUBLIC_PAGE_CACHE_CONTROL, True),
+    "/admin_register_form": (PUBLIC_PAGE_CACHE_CONTROL, True),
+    "/dashboard": (PRIVATE_PAGE_CACHE_CONTROL, False),
+    "/settings": (PRIVATE_PAGE_CACHE_CONTROL, False),
+    "/deal_form": (PRIVATE_PAGE_CACHE_CONTROL, False),
+    "/api/trades": (API_CACHE_CONTROL, True),
+    "/api/analytics": (API_CACHE_CONTROL, True),
+    "/api/equity": (API_CACHE_CONTROL, True),
+    "/api/dashboard": (API_CACHE_CONTROL, True),
+    "/deals/import/status": (API_CACHE_CONTROL, False),
+}
+# Сжатие добавлено последним и поэтому выполняется снаружи: ETag считается по несжатому телу
+app.add_middleware(HTTPCacheMiddleware, policies=HTTP_CACHE_POLICIES)
+app.add_middleware(CompressionMiddleware)
+
+
+@app.exception_handler(HashingBusy)
+def hashing_busy_handler(request: Request, exc: HashingBusy):
+    # Пул хэширования паролей перегружен: клиенту предлагается повторить запрос позже
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Сервис перегружен, повторите попытку позже"},
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+    )
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
 
+# Каталог байткода скомпилированных шаблонов (переживает перезапуски). По умолчанию —
+# личный каталог Jinja _jinja2-cache-<uid> во временном каталоге; пустая строка — без кэша
+TEMPLATE_BYTECODE_DIR = os.getenv("TEMPLATE_BYTECODE_DIR")
+# Кэшировать HTML страниц без токена (/, /login_form, /register_form, /admin_register_form)
+TEMPLATE_RENDER_CACHE = os.getenv("TEMPLATE_RENDER_CACHE", "1") == "1"
+
+# Готовый HTML страниц без токена: {(шаблон, язык, параметры): (HTML, ETag)}
+page_cache = {}
+
 # --- Словарь переводов (переводы для новых полей добавлены) ---
 translations = {
     "en": {
@@ -58,7 +146,19 @@ translations = {
         "api_key": "API Key",
         "secret_key": "Secret Key",
         "passphrase": "Passphrase",
-        "save_api_data": "Save API Data"
+        "save_api_data": "Save API Data",
+        "loading": "Loading...",
+        "not_synced": "Not synced yet",
+        "new_trades": "new trades",
+        "sync_now": "Sync now",
+        "analytics": "Portfolio analytics",
+        "win_rate": "Win rate",
+        "profit_factor": "Profit factor",
+        "avg_win": "Average win",
+        "avg_loss": "Average loss",
+        "max_drawdown": "Max drawdown",
+        "sharpe": "Sharpe ratio",
+        "sortino": "Sortino ratio"
     },
     "ru": {
         "login_title": "Вход",
@@ -90,7 +190,19 @@ translations = {
         "api_key": "API ключ",
         "secret_key": "Секретный ключ",
         "passphrase": "Passphrase",
-        "save_api_data": "Сохранить API данные"
+        "save_api_data": "Сохранить API данные",
+        "loading": "Загрузка...",
+        "not_synced": "Еще не синхронизировано",
+        "new_trades": "новых сделок",
+        "sync_now": "Синхронизировать",
+        "analytics": "Аналитика портфеля",
+        "win_rate": "Доля прибыльных сделок",
+        "profit_factor": "Profit factor",
+        "avg_win": "Средняя прибыль",
+        "avg_loss": "Средний убыток",
+        "max_drawdown": "Максимальная просадка",
+        "sharpe": "Коэффициент Шарпа",
+        "sortino": "Коэффициент Сортино"
     },
     "de": {
         "login_title": "Anmeldung",
@@ -122,7 +234,19 @@ translations = {
         "api_key": "API-Schlüssel",
         "secret_key": "Secret-Schlüssel",
         "passphrase": "Passphrase",
-        "save_api_data": "API-Daten speichern"
+        "save_api_data": "API-Daten speichern",
+        "loading": "Wird geladen...",
+        "not_synced": "Noch nicht synchronisiert",
+        "new_trades": "neue Trades",
+        "sync_now": "Jetzt synchronisieren",
+        "analytics": "Portfolio-Analyse",
+        "win_rate": "Trefferquote",
+        "profit_factor": "Profit-Faktor",
+        "avg_win": "Durchschnittlicher Gewinn",
+        "avg_loss": "Durchschnittlicher Verlust",
+        "max_drawdown": "Maximaler Drawdown",
+        "sharpe": "Sharpe-Ratio",
+        "sortino": "Sortino-Ratio"
     },
     "es": {
         "login_title": "Iniciar sesión",
@@ -154,7 +278,19 @@ translations = {
         "api_key": "API Key",
         "secret_key": "Secret Key",
         "passphrase": "Passphrase",
-        "save_api_data": "Guardar Datos de API"
+        "save_api_data": "Guardar Datos de API",
+        "loading": "Cargando...",
+        "not_synced": "Aún no sincronizado",
+        "new_trades": "operaciones nuevas",
+        "sync_now": "Sincronizar ahora",
+        "analytics": "Análisis de cartera",
+        "win_rate": "Tasa de acierto",
+        "profit_factor": "Factor de beneficio",
+        "avg_win": "Ganancia media",
+        "avg_loss": "Pérdida media",
+        "max_drawdown": "Drawdown máximo",
+        "sharpe": "Ratio de Sharpe",
+        "sortino": "Ratio de Sortino"
     }
 }
 
@@ -163,6 +299,124 @@ def get_translations(lang: str):
     return translations.get(lang, translations["ru"])
 
 
+def render_page(request: Request, name: str, lang: str = None, **params):
+    """
+    Страница, которая зависит только от шаблона, языка и params (без токена
+    и данных пользователя). Для известных языков готовый HTML кэшируется,
+    и повторный запрос сводится к поиску в словаре (вместе с ETag).
+    """
+    key = (name, lang, tuple(sorted(params.items())))
+    cacheable = TEMPLATE_RENDER_CACHE and (lang is None or lang in translations)
+    page = page_cache.get(key) if cacheable else None
+    if page is None:
+        context = {"request": request, "token": "", **params}
+        if lang is not None:
+            context.update(t=get_translations(lang), lang=lang)
+        html = templates.get_template(name).render(context)
+        page = (html, make_etag(html.encode("utf-8")))
+        if cacheable:
+            page_cache[key] = page
+    html, etag = page
+    return HTMLResponse(html, headers={"ETag": etag})
+
+
+def _private_dir(path: str) -> str:
+    """
+    Создает каталог с правами 0700 и проверяет, что он принадлежит процессу
+    и закрыт для остальных: байткод из него загружается как код приложения.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise OSError(f"{path} не является каталогом")
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        raise OSError(f"каталог {path} принадлежит другому пользователю")
+    if st.st_mode & 0o077:
+        raise OSError(f"каталог {path} доступен другим пользователям")
+    return path
+
+
+def load_templates():
+    """
+    Готовит шаблоны и переводы один раз при запуске: компилирует все
+    шаблоны (иначе каждый компилируется при первом запросе в каждом
+    воркере) и дополняет переводы недостающими ключами из русского словаря.
+    Байткод шаблонов сохраняется в TEMPLATE_BYTECODE_DIR, поэтому после
+    перезапуска шаблоны не компилируются заново.
+    """
+    if TEMPLATE_BYTECODE_DIR is None:
+        # Jinja сама создает каталог с правами 0700 и проверяет его владельца
+        templates.env.bytecode_cache = FileSystemBytecodeCache()
+    elif TEMPLATE_BYTECODE_DIR:
+        try:
+            templates.env.bytecode_cache = FileSystemBytecodeCache(
+                _private_dir(TEMPLATE_BYTECODE_DIR))
+        except OSError as e:
+            logger.warning(f"Байткод шаблонов не сохраняется: {e}")
+    page_cache.clear()
+    for name in templates.env.list_templates():
+        templates.env.get_template(name)
+    for table in translations.values():
+        for key, value in translations["ru"].items():
+            table.setdefault(key, value)
+
+
+# Сколько последних сделок показывать на дашборде
+DASHBOARD_TRADES = 20
+# Разделы данных дашборда (параметр fields в /api/dashboard)
+DASHBOARD_SECTIONS = ("metrics", "balances", "syncs", "analytics", "equity", "trades")
+# Как часто (сек.) открытая страница дашборда обновляет цифры через /api/dashboard; 0 — не обновлять
+DASHBOARD_REFRESH_INTERVAL = int(os.getenv("DASHBOARD_REFRESH_INTERVAL", "30"))
+
+# Диапазоны графика капитала: (глубина истории, разрешение агрегатов)
+EQUITY_CHART_RANGES = {
+    "1d": (timedelta(days=1), "minute"),
+    "1w": (timedelta(days=7), "hour"),
+    "1y": (timedelta(days=365), "day"),
+}
+
+
+def build_equity_chart(series, width: int = 300, height: int = 100):
+    """
+    Готовит данные для SVG-графика капитала.
+    :param series: Список пар (время, капитал) из crud.get_equity_series.
+    :return: Словарь с координатами polyline и подписями или None, если точек меньше двух.
+    """
+    if len(series) < 2:
+        return None
+    values = [equity for _, equity in series]
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    step = width / (len(values) - 1)
+    points = " ".join(
+        f"{i * step:.1f},{height - (value - low) / span * height:.1f}" for i, value in enumerate(values)
+    )
+    return {
+        "points": points,
+        "width": width,
+        "height": height,
+        "first": f"{values[0]:.2f}",
+        "last": f"{values[-1]:.2f}",
+        "growing": values[-1] >= values[0],
+    }
+
+
+def format_analytics(result: dict):
+    """Подписи карточек аналитики на дашборде: [(ключ перевода, значение)]."""
+    def number(value, pattern="{:.2f}"):
+        return "N/A" if value is None else pattern.format(value)
+
+    return [
+        ("win_rate", number(result["win_rate"], "{:.1%}")),
+        ("profit_factor", number(result["profit_factor"])),
+        ("avg_win", number(result["avg_win"], "{:+.2f}")),
+        ("avg_loss", number(result["avg_loss"], "{:+.2f}")),
+        ("max_drawdown", number(result["max_drawdown"])),
+        ("sharpe", number(result["sharpe"])),
+        ("sortino", number(result["sortino"])),
+    ]
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -170,6 +424,12 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Асинхронная сессия для async-эндпоинтов: ожидание базы не занимает пул потоков."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # -----------------------------------------------------------------------------
 # Главная страница (приветствие)
 # -----------------------------------------------------------------------------
@@ -177,7 +437,7 @@ def get_db():
 
 @app.get("/", response_class=HTMLResponse)
 def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "message": "Добро пожаловать в Trading Journal!"})
+    return render_page(request, "index.html", message="Добро пожаловать в Trading Journal!")
 
 # -----------------------------------------------------------------------------
 # Форма логина
@@ -187,8 +447,7 @@ def root(request: Request):
 @app.get("/login_form", response_class=HTMLResponse)
 def login_form(request: Request):
     lang = request.query_params.get("lang", "ru")
-    t = get_translations(lang)
-    return templates.TemplateResponse("login.html", {"request": request, "t": t, "lang": lang, "token": ""})
+    return render_page(request, "login.html", lang)
 
 # -----------------------------------------------------------------------------
 # Endpoint для обработки логина и перенаправления в личный кабинет
@@ -196,14 +455,14 @@ def login_form(request: Request):
 
 
 @app.post("/login_form_action", response_class=HTMLResponse)
-def login_form_action(
+async def login_form_action(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     lang = request.query_params.get("lang", "ru")
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
+    if not user:
         t = get_translations(lang)
         return templates.TemplateResponse("login.html", {"request": request, "t": t, "lang": lang, "error": "Неверные учетные данные", "token": ""})
     token = auth.create_access_token({"sub": user.username})
@@ -217,19 +476,19 @@ def login_form_action(
 @app.get("/register_form", response_class=HTMLResponse)
 def register_form(request: Request):
     lang = request.query_params.get("lang", "ru")
-    success = request.query_params.get("success", "")
-    t = get_translations(lang)
-    return templates.TemplateResponse("register.html", {"request": request, "t": t, "lang": lang, "token": "", "success": success})
+    # Шаблону важно только, передан ли success, поэтому значение приводится к "1" или ""
+    success = "1" if request.query_params.get("success") else ""
+    return render_page(request, "register.html", lang, success=success)
 
 
 @app.post("/register_form_action", response_class=HTMLResponse)
-def register_form_action(
+async def register_form_action(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
     date_of_birth: str = Form(...),  # ожидаем дату в формате YYYY-MM-DD
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     lang = request.query_params.get("lang", "ru")
     t = get_translations(lang)
@@ -250,12 +509,11 @@ def register_form_action(
     if age < 16:
         return templates.TemplateResponse("register.html", {"request": request, "t": t, "lang": lang, "error": t["age_error"], "token": ""})
 
-    if crud.get_user_by_username(db, username):
+    if await async_crud.get_user_by_username(db, username):
         return templates.TemplateResponse("register.html", {"request": request, "t": t, "lang": lang, "error": "Пользователь уже существует", "token": ""})
 
-    hashed_pw = auth.get_password_hash(password)
-    new_user = crud.create_user(db, username, hashed_pw, dob)
-    db.commit()
+    hashed_pw = await auth.hash_password(password)
+    new_user = await async_crud.create_user(db, username, hashed_pw, dob)
     return RedirectResponse(url=f"/register_form?lang={lang}&success=1", status_code=303)
 
 # -----------------------------------------------------------------------------
@@ -266,212 +524,287 @@ def register_form_action(
 @app.get("/admin_register_form", response_class=HTMLResponse)
 def admin_register_form(request: Request):
     lang = request.query_params.get("lang", "ru")
-    t = get_translations(lang)
-    return templates.TemplateResponse("admin_register.html", {"request": request, "t": t, "lang": lang, "token": ""})
+    return render_page(request, "admin_register.html", lang)
 
 # -----------------------------------------------------------------------------
 # Страница Dashboard
 # -----------------------------------------------------------------------------
 
 
+async def load_dashboard(db: AsyncSession, user, sections=DASHBOARD_SECTIONS, chart: str = "1w") -> dict:
+    """
+    Собирает данные дашборда из базы и кэшей, без запросов к биржам.
+    Балансы берутся из таблицы balances, которую заполняет фоновый poller.
+    :param sections: Какие разделы загружать (из DASHBOARD_SECTIONS).
+    :return: Словарь {раздел: данные} только с запрошенными разделами.
+    """
+    data = {}
+    stats = None
+    if "metrics" in sections or "trades" in sections:
+        row = await async_crud.get_trade_stats(db, user.id)
+        stats = {
+            "total_trades": row.trade_count if row else 0,
+            "total_wins": row.win_count if row else 0,
+            "total_losses": row.loss_count if row else 0,
+            "total_profit": float(row.gross_profit) - float(row.gross_loss) if row else 0.0,
+        }
+    keys = stored = None
+    if "metrics" in sections or "balances" in sections or "syncs" in sections:
+        keys = await async_crud.get_api_keys(db, user.id)
+        stored = await async_crud.get_user_balances(db, user.id)
+
+    if "metrics" in sections:
+        data["metrics"] = dict(
+            stats,
+            # Общая стоимость по сохраненным балансам и кэшу цен (кэш может быть общим хранилищем)
+            current_balance=await run_in_threadpool(valuation.value_stored_balances, stored),
+            quote=valuation.VALUATION_QUOTE,
+        )
+    if "balances" in sections:
+        # holdings — {актив: количество}, value — стоимость в VALUATION_QUOTE, display —
+        # строка для карточки биржи; None — баланса биржи еще нет (страница догружает его через stream)
+        details = await run_in_threadpool(valuation.stored_balance_details, stored)
+        data["balances"] = [
+            {
+                "exchange": name,
+                "title": config["title"],
+                "holdings": details[name]["holdings"] if name in stored else None,
+                "value": details[name]["value"] if name in stored else None,
+                "display": f"{exchanges.format_stored_balance(name, stored[name].balance)}" if name in stored else None,
+            }
+            for name, config in exchanges.EXCHANGES.items() if name in keys
+        ]
+    if "syncs" in sections:
+        checkpoints = await async_crud.get_trade_checkpoints(db, user.id)
+        data["syncs"] = [
+            {
+                "exchange": name,
+                "title": config["title"],
+                "synced_at": checkpoints[name].synced_at if name in checkpoints else None,
+                "new_trades": checkpoints[name].last_inserted if name in checkpoints else 0,
+            }
+            for name, config in exchanges.EXCHANGES.items() if name in keys
+        ]
+    if "analytics" in sections:
+        data["analytics"] = await analytics.get_user_analytics_async(user.id)
+    if "equity" in sections:
+        period, resolution = EQUITY_CHART_RANGES.get(chart, EQUITY_CHART_RANGES["1w"])
+        series = await async_crud.get_equity_series(db, user.id, resolution, datetime.utcnow() - period)
+        data["equity"] = {
+            "resolution": resolution,
+            "points": [{"ts": bucket, "equity": equity} for bucket, equity in series],
+        }
+    if "trades" in sections:
+        trades = []
+        if stats["total_trades"]:
+            # Последние сделки; капитал после каждой сделки считается назад от итоговой прибыли
+            recent, _ = await async_crud.get_trades_page(db, user.id, limit=DASHBOARD_TRADES)
+            capital = stats["total_profit"]
+            for deal in recent:
+                trades.append({
+                    "executed_at": deal.executed_at,
+                    "platform": deal.platform,
+                    "crypto_currency": deal.crypto_currency,
+                    "profit": deal.profit,
+                    "capital": capital,
+                })
+                capital -= deal.profit
+        data["trades"] = trades
+    return data
+
+
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request, token: str = None, db: Session = Depends(get_db)):
+async def dashboard(request: Request, token: str = None, chart: str = "1w", db: AsyncSession = Depends(get_async_db)):
     lang = request.query_params.get("lang", "ru")
     t = get_translations(lang)
 
-    # Инициализируем переменные балансов как None (если данные отсутствуют)
-    bitget_balance = None
-    binance_balance = None
-    kraken_balance = None
-    kucoin_balance = None
-    cbpro_balance = None
-    mexc_balance = None
-    auto_trades = "[Автоматическая выгрузка сделок из API профиля]"
+    # Биржи, для которых баланса еще нет, показываются с заглушкой и
+    # догружаются через /dashboard/stream.
+    exchange_cards = []
+    trade_syncs = []
+    equity_chart = None
+    deal_metrics = {}
+    portfolio = None
+    total_value = None
+    trades = []
     diagram_placeholder = "[Диаграмма изменения капитала]"
 
     if token:
         try:
-            user = auth.get_current_user_from_token(token, db)
+            user = await auth.get_current_user_async(token, db)
         except Exception as e:
             logger.error(f"Ошибка получения пользователя из токена: {e}")
             user = None
 
         if user:
-            # --- Bitget ---
-            bitget_key = crud.get_api_key(db, user.id, "bitget")
-            if bitget_key:
-                bitget_params = {
-                    "token": token,
-                    "api_key": bitget_key.api_key,
-                    "secret_key": bitget_key.secret_key,
-                    "passphrase": bitget_key.passphrase
-                }
-                try:
-                    resp = requests.get(
-                        "http://bitget-service:8004/get_balance", params=bitget_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, dict) and "balance" in real_balance:
-                        bitget_balance = f"{real_balance['balance']}"
-                    else:
-                        bitget_balance = "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса Bitget: {e}")
-                    bitget_balance = "Ошибка получения данных"
-
-            # --- Binance ---
-            binance_key = crud.get_api_key(db, user.id, "binance")
-            if binance_key:
-                binance_params = {
-                    "token": token,
-                    "api_key": binance_key.api_key,
-                    "secret_key": binance_key.secret_key
-                }
-                try:
-                    resp = requests.get(
-                        "http://binance-service:8001/get_balance", params=binance_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, dict) and "USDT" in real_balance and float(real_balance["USDT"]) > 0:
-                        binance_balance = f"{real_balance['USDT']} USDT"
-                    else:
-                        assets = {k: v for k, v in real_balance.items() if float(
-                            v) > 0} if isinstance(real_balance, dict) else {}
-                        binance_balance = assets if assets else "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса Binance: {e}")
-                    binance_balance = "Ошибка получения данных"
-
-            # --- Kraken ---
-            kraken_key = crud.get_api_key(db, user.id, "kraken")
-            if kraken_key:
-                kraken_params = {
-                    "token": token,
-                    "api_key": kraken_key.api_key,
-                    "secret_key": kraken_key.secret_key
-                }
-                try:
-                    resp = requests.get(
-                        "http://kraken-service:8002/get_balance", params=kraken_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, dict) and "result" in real_balance:
-                        balance_value = real_balance.get(
-                            "result", {}).get("XXBTZUSD", "Нет данных")
-                        kraken_balance = f"{balance_value}"
-                    else:
-                        kraken_balance = "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса Kraken: {e}")
-                    kraken_balance = "Ошибка получения данных"
-
-            # --- Kucoin ---
-            kucoin_key = crud.get_api_key(db, user.id, "kucoin")
-            if kucoin_key:
-                kucoin_params = {
-                    "token": token,
-                    "api_key": kucoin_key.api_key,
-                    "secret_key": kucoin_key.secret_key,
-                    "passphrase": kucoin_key.passphrase
-                }
-                try:
-                    resp = requests.get(
-                        "http://kucoin-service:8006/get_balance", params=kucoin_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, list):
-                        accounts = [f"{acc.get('currency')}: {acc.get('balance')}"
-                                    for acc in real_balance if float(acc.get('balance', 0)) > 0]
-                        kucoin_balance = " , ".join(
-                            accounts) if accounts else "Нет данных"
-                    else:
-                        kucoin_balance = "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса Kucoin: {e}")
-                    kucoin_balance = "Ошибка получения данных"
-
-            # --- CBPro ---
-            cbpro_key = crud.get_api_key(db, user.id, "cbpro")
-            if cbpro_key:
-                cbpro_params = {
-                    "token": token,
-                    "api_key": cbpro_key.api_key,
-                    "secret_key": cbpro_key.secret_key,
-                    "passphrase": cbpro_key.passphrase
+            data = await load_dashboard(db, user, chart=chart)
+            deal_metrics = data["metrics"]
+            total_value = deal_metrics["current_balance"]
+            if deal_metrics["total_trades"]:
+                portfolio = format_analytics(data["analytics"])
+            equity_chart = build_equity_chart(
+                [(point["ts"], point["equity"]) for point in data["equity"]["points"]])
+            exchange_cards = [(item["exchange"], item["title"], item["display"]) for item in data["balances"]]
+            # Состояние синхронизации сделок: (биржа, время, новых сделок)
+            trade_syncs = [
+                (item["title"],
+                 item["synced_at"].strftime("%Y-%m-%d %H:%M") if item["synced_at"] else None,
+                 item["new_trades"])
+                for item in data["syncs"]
+            ]
+            trades = [
+                {
+                    "Date": deal["executed_at"].strftime("%Y-%m-%d %H:%M"),
+                    "Currency_pair": f"{deal['crypto_currency']} ({deal['platform']})",
+                    "WIN_LOSS": f"{deal['profit']:+.2f}",
+                    "Current_capital": f"{deal['capital']:.2f}",
                 }
-                try:
-                    resp = requests.get(
-                        "http://cbpro-service:8003/get_balance", params=cbpro_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, dict) and "balance" in real_balance:
-                        cbpro_balance = f"{real_balance['balance']}"
-                    else:
-                        cbpro_balance = "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса CBPro: {e}")
-                    cbpro_balance = "Ошибка получения данных"
-
-            # --- Mexc ---
-            mexc_key = crud.get_api_key(db, user.id, "mexc")
-            if mexc_key:
-                mexc_params = {
-                    "token": token,
-                    "api_key": mexc_key.api_key,
-                    "secret_key": mexc_key.secret_key
-                }
-                try:
-                    resp = requests.get(
-                        "http://mexc-service:8005/get_balance", params=mexc_params)
-                    resp.raise_for_status()
-                    real_balance = resp.json()
-                    if isinstance(real_balance, dict) and "data" in real_balance:
-                        mexc_balance = f"{real_balance['data'].get('balance', 'Нет данных')}"
-                    else:
-                        mexc_balance = "Нет данных"
-                except Exception as e:
-                    logger.error(f"Ошибка запроса баланса Mexc: {e}")
-                    mexc_balance = "Ошибка получения данных"
-
-    # Формируем итоговую сводку (выводим данные только для бирж, для которых есть API ключи)
-    metric_lines = []
-    if bitget_balance is not None:
-        metric_lines.append(f"Bitget: {bitget_balance}")
-    if binance_balance is not None:
-        metric_lines.append(f"Binance: {binance_balance}")
-    if kraken_balance is not None:
-        metric_lines.append(f"Kraken: {kraken_balance}")
-    if kucoin_balance is not None:
-        metric_lines.append(f"Kucoin: {kucoin_balance}")
-    if cbpro_balance is not None:
-        metric_lines.append(f"CBPro: {cbpro_balance}")
-    if mexc_balance is not None:
-        metric_lines.append(f"Mexc: {mexc_balance}")
-
-    capital_overview = " | ".join(metric_lines) if metric_lines else "N/A"
+                for deal in data["trades"]
+            ]
 
     metrics = {
-        "capital_overview": capital_overview,
-        "auto_trades": auto_trades or "N/A",
+        "capital_overview": "N/A",
+        "current_balance": "N/A" if total_value is None else f"{total_value:.2f} {valuation.VALUATION_QUOTE}",
         "diagram_capital": diagram_placeholder or "N/A",
-        "total_trades": "N/A",
-        "total_profit": "N/A",
-        "total_losses": "N/A",
-        "total_wins": "N/A"
+        "total_trades": deal_metrics.get("total_trades", "N/A"),
+        "total_profit": deal_metrics.get("total_profit", "N/A"),
+        "total_losses": deal_metrics.get("total_losses", "N/A"),
+        "total_wins": deal_metrics.get("total_wins", "N/A")
     }
 
-    trades = []  # Здесь можно добавить историю сделок
-
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "t": t,
         "lang": lang,
         "metrics": metrics,
+        "exchange_cards": exchange_cards,
+        "trade_syncs": trade_syncs,
+        "portfolio": portfolio,
+        "equity_chart": equity_chart,
+        "chart": chart if chart in EQUITY_CHART_RANGES else "1w",
+        "pending_balances": any(value is None for _, _, value in exchange_cards),
+        "refresh_interval": DASHBOARD_REFRESH_INTERVAL,
         "trades": trades,
         "token": token or ""
     })
 
 
+@app.get("/api/dashboard")
+async def dashboard_data(
+    token: str,
+    fields: Optional[str] = None,
+    chart: str = "1w",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Данные дашборда в JSON для частичного обновления страницы без ее перерисовки.
+    fields — разделы через запятую (metrics, balances, syncs, analytics, equity,
+    trades), по умолчанию все; например, fields=balances отдает только балансы.
+    """
+    user = await auth.get_current_user_async(token, db)
+    sections = DASHBOARD_SECTIONS
+    if fields:
+        sections = tuple(name.strip() for name in fields.split(",") if name.strip())
+        unknown = set(sections) - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Неизвестные разделы: {', '.join(sorted(unknown))}")
+    if chart not in EQUITY_CHART_RANGES:
+        raise HTTPException(status_code=400, detail="Неизвестный диапазон графика")
+    # orjson сериализует datetime и float заметно быстрее стандартного json
+    return ORJSONResponse(await load_dashboard(db, user, sections, chart))
+
+
+@app.get("/dashboard/stream")
+def dashboard_stream(token: str, db: Session = Depends(get_db)):
+    """
+    Server-Sent Events: по одному событию "balance" на каждую биржу
+    пользователя по мере получения баланса, в конце событие "done".
+    Сохраненные балансы отдаются сразу, остальные запрашиваются у бирж.
+    """
+    user = auth.get_current_user_from_token(token, db)
+    keys = crud.get_api_keys(db, user.id)
+    stored = {
+        name: exchanges.format_stored_balance(name, row.balance)
+        for name, row in crud.get_user_balances(db, user.id).items() if name in keys
+    }
+    missing = {name: key for name, key in keys.items() if name not in stored}
+
+    def balances():
+        yield from stored.items()
+        yield from exchanges.iter_balances(missing, token, user.id)
+
+    def events():
+        for name, value in balances():
+            data = {"exchange": name, "title": exchanges.EXCHANGES[name]["title"], "value": f"{value}"}
+            yield f"event: balance\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/trades", response_model=schemas.TradePage)
+async def trade_history(
+    token: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    platform: Optional[str] = None,
+    crypto_currency: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    История сделок пользователя от новых к старым. Следующая страница
+    запрашивается с cursor=next_cursor из предыдущего ответа.
+    """
+    user = await auth.get_current_user_async(token, db)
+    try:
+        items, next_cursor = await async_crud.get_trades_page(
+            db, user.id, limit, cursor, platform, crypto_currency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get("/api/analytics")
+def portfolio_analytics(token: str, db: Session = Depends(get_db)):
+    """
+    Показатели портфеля пользователя: прибыль, просадка, доля прибыльных
+    сделок, profit factor, коэффициенты Шарпа и Сортино, кривая капитала
+    и скользящий PnL.
+    """
+    user = auth.get_current_user_from_token(token, db)
+    return analytics.get_user_analytics(db, user.id)
+
+
+@app.post("/sync_trades")
+def sync_trades(
+    token: str = Form(...),
+    lang: str = Query("ru"),
+    db: Session = Depends(get_db)
+):
+    """Немедленная синхронизация сделок со всех бирж пользователя."""
+    user = auth.get_current_user_from_token(token, db)
+    trade_sync.sync_user_trades(db, user.id, force=True)
+    return RedirectResponse(url=f"/dashboard?lang={lang}&token={token}", status_code=303)
+
+
+@app.get("/api/equity")
+def equity_history(token: str, chart: str = "1w", db: Session = Depends(get_db)):
+    """История капитала пользователя по всем биржам из агрегатов equity_rollups."""
+    user = auth.get_current_user_from_token(token, db)
+    if chart not in EQUITY_CHART_RANGES:
+        raise HTTPException(status_code=400, detail="Неизвестный диапазон графика")
+    period, resolution = EQUITY_CHART_RANGES[chart]
+    series = crud.get_equity_series(db, user.id, resolution, datetime.utcnow() - period)
+    return {
+        "resolution": resolution,
+        "points": [{"ts": bucket.isoformat(), "equity": equity} for bucket, equity in series],
+    }
+
+
 # -----------------------------------------------------------------------------
 # Страница Settings (обновление персональных данных и API)
 # -----------------------------------------------------------------------------
@@ -517,10 +850,7 @@ def update_settings(
     lang = request.query_params.get("lang", "ru")
     token = request.query_params.get("token", "")
     user = auth.get_current_user_from_token(token, db)
-    user.email = email
-    user.phone = phone
-    db.commit()
-    db.refresh(user)
+    crud.update_user(db, user.id, email=email, phone=phone)
     return RedirectResponse(url=f"/dashboard?lang={lang}&token={token}", status_code=303)
 
 # -----------------------------------------------------------------------------
@@ -580,9 +910,12 @@ def create_deal(
     quantity_bought: float = Form(...),
     quantity_sold: float = Form(...),
     exchange_rate: float = Form(...),
+    token: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
-    profit = (quantity_sold - quantity_bought) * exchange_rate
+    # Сделка привязывается к пользователю, если форма отправлена из личного кабинета
+    user = auth.get_current_user_from_token(token, db) if token else None
+    profit = crud.calculate_profit(quantity_bought, quantity_sold, exchange_rate)
     deal_data = schemas.DealCreate(
         full_name=full_name,
         password=password,
@@ -593,7 +926,32 @@ def create_deal(
         quantity_sold=quantity_sold,
         exchange_rate=exchange_rate
     )
-    return crud.create_deal(db, deal_data, profit)
+    return crud.create_deal(db, deal_data, profit, user.id if user else None)
+
+
+@app.post("/deals/import")
+def import_deals(
+    file: UploadFile = File(...),
+    token: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Импорт сделок из CSV или JSONL (колонки как у формы сделки, опционально
+    trade_id и profit). Возвращает отчет с числом вставленных, пропущенных
+    дублей и ошибками строк.
+    """
+    user = auth.get_current_user_from_token(token, db)
+    return importer.import_deals(db, user, file.file, file.filename)
+
+
+@app.get("/deals/import/status")
+def import_deals_status(token: str, db: Session = Depends(get_db)):
+    """Ход текущего или результат последнего импорта пользователя."""
+    user = auth.get_current_user_from_token(token, db)
+    report = importer.get_progress(user.id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Импорт не найден")
+    return report
 
 # -----------------------------------------------------------------------------
 # JSON API эндпоинты (register, token, admin/create_user)
@@ -601,58 +959,48 @@ def create_deal(
 
 
 @app.post("/register", response_model=schemas.User)
-def register(username: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
-    if crud.get_user_by_username(db, username):
+async def register(username: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_async_db)):
+    if await async_crud.get_user_by_username(db, username):
         raise HTTPException(
             status_code=400, detail="Пользователь уже существует")
-    hashed_pw = auth.get_password_hash(password)
+    hashed_pw = await auth.hash_password(password)
     # Здесь вызываем create_user с датой рождения.
     # В данном endpoint-е дату рождения не передают, поэтому этот endpoint можно оставить для API,
     # а регистрацию через форму обрабатывать через /register_form_action.
-    return crud.create_user(db, username, hashed_pw, date(1970, 1, 1))
+    return await async_crud.create_user(db, username, hashed_pw, date(1970, 1, 1))
 
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await auth.authenticate_user(db, form_data.username, form_data.password)
+    if not user:
         raise HTTPException(status_code=400, detail="Неверные учетные данные")
     token = auth.create_access_token({"sub": user.username})
     return {"access_token": token, "token_type": "bearer"}
 
 
 @app.post("/admin/create_user", response_model=schemas.User)
-def admin_create_user(username: str = Form(...), password: str = Form(...), token: str = Form(...), db: Session = Depends(get_db)):
-    admin_user = auth.get_current_user_from_token(token, db)
+async def admin_create_user(username: str = Form(...), password: str = Form(...), token: str = Form(...), db: AsyncSession = Depends(get_async_db)):
+    admin_user = await auth.get_current_user_async(token, db)
     if admin_user.username != "admin":
         raise HTTPException(
             status_code=403, detail="Требуется доступ администратора")
-    if crud.get_user_by_username(db, username):
+    if await async_crud.get_user_by_username(db, username):
         raise HTTPException(
             status_code=400, detail="Пользователь уже существует")
-    hashed_pw = auth.get_password_hash(password)
-    return crud.create_user(db, username, hashed_pw, date(1970, 1, 1))
-
-# -----------------------------------------------------------------------------
-# Функция для создания мастер-админа (если не существует)
-# -----------------------------------------------------------------------------
-
-
-def seed_admin():
-    db = SessionLocal()
-    if not crud.get_user_by_username(db, "admin"):
-        admin_pw = auth.get_password_hash("admin")
-        new_admin = crud.create_user(db, "admin", admin_pw, date(1970, 1, 1))
-        db.commit()
-        logger.info("Мастер-админ создан: login=admin, password=admin")
-    db.close()
-
-
-seed_admin()
+    hashed_pw = await auth.hash_password(password)
+    return await async_crud.create_user(db, username, hashed_pw, date(1970, 1, 1))
 
 # -----------------------------------------------------------------------------
 # Запуск приложения
 # -----------------------------------------------------------------------------
 if __name__ == "__main__":
+    import argparse
     import uvicorn
+    parser = argparse.ArgumentParser(prog="python -m backend.main")
+    parser.add_argument("--skip-seed", action="store_true",
+                        help="не создавать мастер-админа при запуске")
+    args = parser.parse_args()
+    if args.skip_seed:
+        seed_on_startup = False
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
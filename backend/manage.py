@@ -0,0 +1,60 @@
+"""
+Служебные команды бэкенда.
+
+Примеры:
+    python -m backend.manage init-db
+    python -m backend.manage init-db --skip-seed
+    python -m backend.manage rebuild-stats
+    python -m backend.manage rebuild-stats --user-id 42
+"""
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+import backend.crud as crud
+from backend.bootstrap import prepare_database
+from backend.database import SessionLocal, engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def init_database(args):
+    # Вся работа выполняется в main() через prepare_database
+    logger.info("База данных подготовлена")
+
+
+def rebuild_stats(args):
+    db = SessionLocal()
+    try:
+        count = crud.rebuild_trade_stats(db, args.user_id)
+    finally:
+        db.close()
+    logger.info(f"Статистика сделок пересчитана, строк: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser(
+        "init-db", help="создать таблицы, применить миграции и создать мастер-админа")
+    init.add_argument("--skip-seed", dest="seed", action="store_false",
+                      help="не создавать мастер-админа")
+    init.set_defaults(handler=init_database, seed=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-stats", help="пересчитать таблицу trade_stats по сделкам")
+    rebuild.add_argument("--user-id", type=int, default=None,
+                         help="пересчитать только указанного пользователя")
+    rebuild.set_defaults(handler=rebuild_stats, seed=False)
+
+    args = parser.parse_args(argv)
+    load_dotenv()
+    prepare_database(engine, seed=args.seed)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Простые миграции схемы для уже существующих баз.
+
+models.Base.metadata.create_all создает только отсутствующие таблицы, поэтому
+колонки и индексы, добавленные в модели позже, дописываются здесь, а смена
+типов колонок выполняется отдельными функциями.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import String, inspect
+
+import backend.models as models
+
+logger = logging.getLogger(__name__)
+
+# Колонки сделок, которые раньше хранились строками
+DEAL_NUMERIC_COLUMNS = ("quantity_bought", "quantity_sold", "exchange_rate", "profit")
+# Таблицы с одной строкой на пару пользователь + биржа (уникальный индекс)
+USER_EXCHANGE_TABLES = ("api_keys", "balances")
+
+
+def _add_column(conn, table_name: str, column):
+    """Добавляет в существующую таблицу колонку модели (всегда как NULL-able)."""
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.exec_driver_sql(
+        f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}")
+    logger.info(f"Миграция: добавлена колонка {table_name}.{column.name}")
+
+
+def add_missing_columns(conn):
+    """Добавляет в существующие таблицы колонки, которых в них еще нет."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                _add_column(conn, table.name, column)
+
+
+def add_missing_indexes(conn):
+    """Создает индексы моделей, которых еще нет в существующих таблицах."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in models.Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                logger.info(f"Миграция: создан индекс {index.name}")
+
+
+def _rebuild_sqlite_table(conn, table, old_columns, casts: dict):
+    """
+    Пересоздает таблицу SQLite по текущей модели и переносит данные.
+    SQLite не умеет менять тип колонки через ALTER TABLE.
+    :param casts: SQL-выражения для колонок, значения которых нужно преобразовать.
+    """
+    backup = f"{table.name}_old"
+    conn.exec_driver_sql(f"CREATE TABLE {backup} AS SELECT * FROM {table.name}")
+    conn.exec_driver_sql(f"DROP TABLE {table.name}")
+    table.create(conn)
+    names = [c.name for c in table.columns if c.name in old_columns]
+    values = ", ".join(casts.get(name, name) for name in names)
+    conn.exec_driver_sql(
+        f"INSERT INTO {table.name} ({', '.join(names)}) SELECT {values} FROM {backup}")
+    conn.exec_driver_sql(f"DROP TABLE {backup}")
+
+
+def convert_deal_numbers(conn):
+    """Переводит количества, курс и прибыль сделок из строк в числа."""
+    inspector = inspect(conn)
+    if "deals" not in inspector.get_table_names():
+        return
+    columns = {c["name"]: c["type"] for c in inspector.get_columns("deals")}
+    to_convert = [name for name in DEAL_NUMERIC_COLUMNS if isinstance(columns.get(name), String)]
+    if not to_convert:
+        return
+    table = models.Deal.__table__
+    if conn.dialect.name == "sqlite":
+        casts = {name: f"CAST(NULLIF(TRIM({name}), '') AS REAL)" for name in to_convert}
+        _rebuild_sqlite_table(conn, table, columns, casts)
+    else:
+        for name in to_convert:
+            column_type = table.c[name].type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(
+                f"ALTER TABLE deals ALTER COLUMN {name} TYPE {column_type} "
+                f"USING NULLIF(TRIM({name}), '')::numeric")
+    logger.info(f"Миграция: колонки сделок {', '.join(to_convert)} переведены в числовой тип")
+
+
+def remove_duplicate_user_exchange_rows(conn):
+    """
+    Удаляет дубли (user_id, exchange) перед созданием уникальных индексов.
+    Остается строка с наименьшим id — ее и обновлял прежний код.
+    """
+    existing_tables = set(inspect(conn).get_table_names())
+    for table in USER_EXCHANGE_TABLES:
+        if table not in existing_tables:
+            continue
+        result = conn.exec_driver_sql(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY user_id, exchange)")
+        if result.rowcount:
+            logger.info(f"Миграция: удалено дублей в {table}: {result.rowcount}")
+
+
+def backfill_deal_executed_at(conn):
+    """Проставляет время исполнения сделкам, созданным до появления колонки."""
+    deals = models.Deal.__table__
+    result = conn.execute(
+        deals.update().where(deals.c.executed_at.is_(None)).values(executed_at=datetime.utcnow()))
+    if result.rowcount:
+        logger.info(f"Миграция: executed_at заполнен у {result.rowcount} сделок")
+
+
+def run_migrations(engine):
+    """Приводит схему существующей базы к текущим моделям."""
+    with engine.begin() as conn:
+        convert_deal_numbers(conn)
+        add_missing_columns(conn)
+        remove_duplicate_user_exchange_rows(conn)
+        add_missing_indexes(conn)
+        backfill_deal_executed_at(conn)
+
+
+def init_db(engine):
+    """Создает отсутствующие таблицы и применяет миграции."""
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
@@ -1,7 +1,11 @@
 #from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy import Column, Integer, String, Date, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, Numeric, Date, DateTime, ForeignKey, Index, LargeBinary, UniqueConstraint
 from backend.database import Base
 
+# Числовые поля сделок; значения отдаются как float, как в схемах
+DEAL_NUMBER = Numeric(28, 10, asdecimal=False)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -19,6 +23,10 @@ class APIKey(Base):
     secret_key = Column(String)
     passphrase = Column(String, nullable=True)   # новое поле
     user_id = Column(Integer, ForeignKey("users.id"))
+    __table_args__ = (
+        # Один ключ на биржу у пользователя; нужен и для INSERT ... ON CONFLICT
+        Index("ux_api_keys_user_exchange", "user_id", "exchange", unique=True),
+    )
 
 
 class Balance(Base):
@@ -26,7 +34,42 @@ class Balance(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     exchange = Column(String, index=True)
-    balance = Column(String)
+    balance = Column(String)  # JSON-ответ микросервиса биржи
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ux_balances_user_exchange", "user_id", "exchange", unique=True),
+    )
+
+class EquitySnapshot(Base):
+    """Сырые точки капитала: одна запись на каждый успешный опрос биржи."""
+    __tablename__ = "equity_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    exchange = Column(String)
+    ts = Column(DateTime, index=True)
+    equity = Column(Float)
+    __table_args__ = (
+        Index("ix_equity_snapshots_user_exchange_ts", "user_id", "exchange", "ts"),
+    )
+
+
+class EquityRollup(Base):
+    """Агрегаты капитала за минуту/час/день (OHLC по точкам внутри интервала)."""
+    __tablename__ = "equity_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    exchange = Column(String)
+    resolution = Column(String)  # "minute", "hour" или "day"
+    bucket = Column(DateTime)    # начало интервала
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    samples = Column(Integer, default=0)
+    __table_args__ = (
+        UniqueConstraint("user_id", "resolution", "bucket", "exchange",
+                         name="uq_equity_rollups_user_resolution_bucket_exchange"),
+    )
 
 class Deal(Base):
     __tablename__ = "deals"
@@ -36,7 +79,68 @@ class Deal(Base):
     api_key = Column(String)
     platform = Column(String, index=True)
     crypto_currency = Column(String, index=True)
-    quantity_bought = Column(String)
-    quantity_sold = Column(String)
-    exchange_rate = Column(String)
-    profit = Column(String)
+    quantity_bought = Column(DEAL_NUMBER)
+    quantity_sold = Column(DEAL_NUMBER)
+    exchange_rate = Column(DEAL_NUMBER)
+    profit = Column(DEAL_NUMBER)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=True)
+    # Идентификатор сделки из импорта или синхронизации с биржей (для защиты от дублей)
+    external_id = Column(String, nullable=True)
+    executed_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ux_deals_user_external_id", "user_id", "external_id", unique=True),
+        # История сделок пользователя: постраничный обход по (executed_at, id)
+        Index("ix_deals_user_executed_id", "user_id", "executed_at", "id"),
+    )
+
+
+class TradeSyncCheckpoint(Base):
+    """Курсор последней синхронизации сделок пользователя с биржей (см. backend/trade_sync.py)."""
+    __tablename__ = "trade_sync_checkpoints"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    exchange = Column(String)
+    cursor = Column(String, nullable=True)  # непрозрачный курсор микросервиса биржи
+    synced_at = Column(DateTime, default=datetime.utcnow)
+    last_inserted = Column(Integer, default=0)  # новых сделок при последней синхронизации
+    __table_args__ = (
+        UniqueConstraint("user_id", "exchange", name="uq_trade_sync_checkpoints_user_exchange"),
+    )
+
+
+class TradeStats(Base):
+    """
+    Накопительная статистика сделок пользователя. Строка с пустыми platform
+    и crypto_currency — итог по всем сделкам пользователя, остальные строки —
+    по паре платформа + валюта. Обновляется в crud.create_deal.
+    """
+    __tablename__ = "trade_stats"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    platform = Column(String, default="")
+    crypto_currency = Column(String, default="")
+    trade_count = Column(Integer, default=0)
+    win_count = Column(Integer, default=0)
+    loss_count = Column(Integer, default=0)
+    gross_profit = Column(DEAL_NUMBER, default=0)
+    gross_loss = Column(DEAL_NUMBER, default=0)  # сумма убытков, положительное число
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        UniqueConstraint("user_id", "platform", "crypto_currency",
+                         name="uq_trade_stats_user_platform_currency"),
+    )
+
+
+class DealSnapshot(Base):
+    """
+    Сохраненные массивы сделок пользователя для аналитики (см. backend/analytics.py):
+    время исполнения (datetime64[us]) и прибыль (float64) всех сделок с id не
+    больше max_id в порядке исполнения. Воркер читает их вместо всех сделок
+    и дочитывает из deals только более новые.
+    """
+    __tablename__ = "deal_snapshots"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    max_id = Column(Integer)
+    executed_at = Column(LargeBinary)
+    profit = Column(LargeBinary)
+    updated_at = Column(DateTime, default=datetime.utcnow)
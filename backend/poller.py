@@ -0,0 +1,132 @@
+"""
+Фоновое обновление балансов бирж.
+
+BalancePoller раз в BALANCE_POLL_INTERVAL секунд обходит всех пользователей
+с API-ключами и сохраняет балансы в таблицу balances. Пользователи
+равномерно (со случайным сдвигом) распределяются по интервалу, чтобы не
+создавать всплеск запросов к биржам, а число одновременных запросов к
+одной бирже ограничено BALANCE_POLL_CONCURRENCY.
+Каждый полученный баланс также оценивается по кэшу цен и записывается в
+историю капитала (crud.record_equity), а устаревшие точки истории удаляются раз в цикл.
+После балансов синхронизируются новые сделки пользователя (не чаще
+TRADE_SYNC_INTERVAL, см. backend/trade_sync.py).
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backend.crud as crud
+import backend.exchanges as exchanges
+import backend.trade_sync as trade_sync
+import backend.valuation as valuation
+from backend.cache import balance_cache
+from backend.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+BALANCE_POLL_ENABLED = os.getenv("BALANCE_POLL_ENABLED", "1") == "1"
+BALANCE_POLL_INTERVAL = float(os.getenv("BALANCE_POLL_INTERVAL", "60"))
+BALANCE_POLL_CONCURRENCY = int(os.getenv("BALANCE_POLL_CONCURRENCY", "4"))
+BALANCE_POLL_WORKERS = int(os.getenv("BALANCE_POLL_WORKERS", "8"))
+
+
+class BalancePoller:
+    def __init__(self, interval: float = BALANCE_POLL_INTERVAL,
+                 concurrency: int = BALANCE_POLL_CONCURRENCY,
+                 workers: int = BALANCE_POLL_WORKERS):
+        self.interval = interval
+        self._limits = {
+            name: threading.BoundedSemaphore(concurrency) for name in exchanges.EXCHANGES
+        }
+        self._workers = workers
+        self._executor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="balance-poll")
+        self._thread = threading.Thread(
+            target=self._run, name="balance-poller", daemon=True)
+        self._thread.start()
+        logger.info(f"Фоновое обновление балансов запущено, интервал {self.interval} сек.")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            cycle_start = time.monotonic()
+            try:
+                self._run_cycle(cycle_start)
+                self._prune_equity()
+            except Exception as e:
+                logger.error(f"Ошибка цикла обновления балансов: {e}")
+            self._stop.wait(max(cycle_start + self.interval - time.monotonic(), 0))
+
+    def _run_cycle(self, cycle_start: float):
+        db = SessionLocal()
+        try:
+            user_ids = crud.get_user_ids_with_api_keys(db)
+        finally:
+            db.close()
+        if not user_ids:
+            return
+        random.shuffle(user_ids)
+        slot = self.interval / len(user_ids)
+        for i, user_id in enumerate(user_ids):
+            # Каждый пользователь получает свой слот интервала со случайным сдвигом внутри
+            start_at = cycle_start + slot * (i + random.random())
+            if self._stop.wait(max(start_at - time.monotonic(), 0)):
+                return
+            self._executor.submit(self.poll_user, user_id)
+
+    def _prune_equity(self):
+        db = SessionLocal()
+        try:
+            crud.prune_equity(db)
+        finally:
+            db.close()
+
+    def poll_user(self, user_id: int):
+        """Запрашивает и сохраняет балансы всех бирж пользователя и синхронизирует его сделки."""
+        db = SessionLocal()
+        try:
+            keys = crud.get_api_keys(db, user_id)
+            for name in exchanges.EXCHANGES:
+                if name not in keys or self._stop.is_set():
+                    continue
+                params = exchanges.build_params(name, keys[name])
+                try:
+                    with self._limits[name]:
+                        data = exchanges.fetch_balance(name, params)
+                except Exception as e:
+                    logger.error(
+                        f"Ошибка фонового запроса баланса {exchanges.EXCHANGES[name]['title']}: {e}")
+                    continue
+                balance_cache.set((user_id, name), data)
+                crud.set_balance(db, user_id, name, json.dumps(data))
+                equity = valuation.get_equity(name, data)
+                if equity is not None:
+                    crud.record_equity(db, user_id, name, equity)
+            if trade_sync.TRADE_SYNC_ENABLED and not self._stop.is_set():
+                trade_sync.sync_user_trades(db, user_id, limits=self._limits)
+        except Exception as e:
+            logger.error(f"Ошибка обновления балансов пользователя {user_id}: {e}")
+        finally:
+            db.close()
+
+
+balance_poller = BalancePoller()
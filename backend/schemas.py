@@ -1,3 +1,5 @@
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 class User(BaseModel):
@@ -42,6 +44,7 @@ class DealCreate(BaseModel):
     quantity_bought: float
     quantity_sold: float
     exchange_rate: float
+    executed_at: Optional[datetime] = None
 
 class Deal(BaseModel):
     id: int
@@ -54,5 +57,23 @@ class Deal(BaseModel):
     quantity_sold: float
     exchange_rate: float
     profit: float
+    user_id: Optional[int] = None
+    executed_at: Optional[datetime] = None
     class Config:
         from_attributes = True
+
+class Trade(BaseModel):
+    id: int
+    platform: str
+    crypto_currency: str
+    quantity_bought: float
+    quantity_sold: float
+    exchange_rate: float
+    profit: float
+    executed_at: datetime
+    class Config:
+        from_attributes = True
+
+class TradePage(BaseModel):
+    items: List[Trade]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,78 @@
+"""
+Реестр микросервисов бирж и общий HTTP-клиент для обращения к ним.
+
+Базовые адреса сервисов берутся из переменных окружения вида
+BITGET_SERVICE_URL; по умолчанию используются имена контейнеров из
+docker-compose. Все запросы идут через одну долгоживущую requests.Session
+с отдельным пулом keep-alive соединений на каждый сервис.
+"""
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_SERVICE_URLS = {
+    "binance": "http://binance-service:8001",
+    "kraken": "http://kraken-service:8002",
+    "cbpro": "http://cbpro-service:8003",
+    "bitget": "http://bitget-service:8004",
+    "mexc": "http://mexc-service:8005",
+    "kucoin": "http://kucoin-service:8006",
+}
+
+# Размер пула соединений к одному сервису
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+# Таймауты (сек.) на установку соединения и чтение ответа
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "2"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+# Повторы при ошибках соединения и ответах 502/503/504
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", "0.2"))
+
+
+def load_service_registry() -> dict:
+    """Возвращает словарь {биржа: базовый URL сервиса} с учетом переменных окружения."""
+    return {
+        exchange: os.getenv(f"{exchange.upper()}_SERVICE_URL", default).rstrip("/")
+        for exchange, default in DEFAULT_SERVICE_URLS.items()
+    }
+
+
+SERVICE_URLS = load_service_registry()
+
+
+def _create_session(service_urls: dict) -> requests.Session:
+    retry = Retry(
+        total=HTTP_RETRIES,
+        connect=HTTP_RETRIES,
+        # Повтор чтения удвоил бы ожидание медленной биржи
+        read=0,
+        status=HTTP_RETRIES,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    for base_url in service_urls.values():
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        session.mount(base_url + "/", adapter)
+    return session
+
+
+session = _create_session(SERVICE_URLS)
+
+
+def get(exchange: str, path: str, params: dict = None, read_timeout: float = None):
+    """
+    Выполняет GET-запрос к микросервису биржи через общий пул соединений.
+    :param exchange: Название биржи из SERVICE_URLS.
+    :param path: Путь эндпоинта, например "/get_balance".
+    :param read_timeout: Таймаут чтения; по умолчанию HTTP_READ_TIMEOUT.
+    :return: requests.Response
+    """
+    url = SERVICE_URLS[exchange] + path
+    timeout = (HTTP_CONNECT_TIMEOUT, read_timeout or HTTP_READ_TIMEOUT)
+    return session.get(url, params=params, timeout=timeout)
@@ -0,0 +1,113 @@
+"""
+Инкрементальная синхронизация сделок с бирж.
+
+Каждый микросервис биржи отдает на /get_trades сделки, появившиеся после
+переданного курсора, и новый курсор. Курсор хранится в таблице
+trade_sync_checkpoints отдельно для каждой пары пользователь + биржа,
+поэтому при каждой синхронизации запрашивается только новая часть истории.
+Сделки сохраняются с external_id вида "<биржа>:<id сделки>" — повторная
+выдача той же сделки (или ее импорт из выгрузки с trade_id) не создает
+дублей. Новые сделки, курсор и статистика записываются одной транзакцией.
+"""
+import logging
+import os
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+import backend.crud as crud
+import backend.exchanges as exchanges
+import backend.services as services
+
+logger = logging.getLogger(__name__)
+
+TRADE_SYNC_ENABLED = os.getenv("TRADE_SYNC_ENABLED", "1") == "1"
+# Как часто (сек.) фоновый poller синхронизирует сделки одной биржи пользователя
+TRADE_SYNC_INTERVAL = float(os.getenv("TRADE_SYNC_INTERVAL", "300"))
+# Таймаут чтения ответа /get_trades: история может собираться по нескольким парам
+TRADE_SYNC_TIMEOUT = float(os.getenv("TRADE_SYNC_TIMEOUT", "30"))
+
+
+def trade_to_deal(exchange: str, trade: dict, user) -> dict:
+    """
+    Превращает сделку микросервиса в значения для models.Deal.
+    Покупка записывается как quantity_bought, продажа — как quantity_sold.
+    Отдельное исполнение не несет реализованной прибыли (формула сделок из
+    формы записала бы покупку убытком, а продажу — прибылью на весь объем),
+    поэтому profit равен 0: сделка учитывается в числе сделок, но не среди
+    прибыльных и убыточных.
+    """
+    qty = float(trade["qty"])
+    price = float(trade["price"])
+    bought, sold = (qty, 0.0) if trade["side"] == "buy" else (0.0, qty)
+    return {
+        "full_name": user.username,
+        "password": "",
+        "api_key": "",
+        "platform": exchange,
+        "crypto_currency": trade["asset"],
+        "quantity_bought": bought,
+        "quantity_sold": sold,
+        "exchange_rate": price,
+        "profit": 0.0,
+        "user_id": user.id,
+        "external_id": f"{exchange}:{trade['id']}",
+        "executed_at": datetime.utcfromtimestamp(int(trade["time"]) / 1000),
+    }
+
+
+def sync_exchange(db: Session, user, exchange: str, key, cursor: str = None) -> int:
+    """
+    Загружает сделки одной биржи после cursor и сохраняет их вместе с новым курсором.
+    :return: Число новых сделок.
+    """
+    params = exchanges.build_params(exchange, key)
+    if cursor:
+        params["since"] = cursor
+    response = services.get(exchange, "/get_trades", params, read_timeout=TRADE_SYNC_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+    rows = [trade_to_deal(exchange, trade, user) for trade in data.get("trades", [])]
+    inserted = crud.insert_new_deals(db, user.id, rows) if rows else 0
+    crud.set_trade_checkpoint(db, user.id, exchange, data.get("cursor") or cursor, inserted)
+    db.commit()
+    return inserted
+
+
+def sync_user_trades(db: Session, user_id: int, force: bool = False, limits: dict = None) -> dict:
+    """
+    Синхронизирует сделки всех бирж пользователя.
+    :param force: Синхронизировать, даже если с прошлого раза не прошло TRADE_SYNC_INTERVAL.
+    :param limits: Семафоры {биржа: семафор}, ограничивающие одновременные запросы.
+    :return: Словарь {биржа: число новых сделок или None при ошибке}.
+    """
+    user = crud.get_user(db, user_id)
+    if not user:
+        return {}
+    keys = crud.get_api_keys(db, user_id)
+    checkpoints = crud.get_trade_checkpoints(db, user_id)
+    due = datetime.utcnow() - timedelta(seconds=TRADE_SYNC_INTERVAL)
+    result = {}
+    for name in exchanges.EXCHANGES:
+        if name not in keys:
+            continue
+        checkpoint = checkpoints.get(name)
+        if checkpoint and not force and checkpoint.synced_at > due:
+            continue
+        try:
+            with (limits or {}).get(name) or nullcontext():
+                result[name] = sync_exchange(
+                    db, user, name, keys[name], checkpoint.cursor if checkpoint else None)
+        except Exception as e:
+            db.rollback()
+            logger.error(
+                f"Ошибка синхронизации сделок {exchanges.EXCHANGES[name]['title']} "
+                f"пользователя {user_id}: {e}")
+            result[name] = None
+            continue
+        if result[name]:
+            logger.info(
+                f"Синхронизация сделок {exchanges.EXCHANGES[name]['title']} "
+                f"пользователя {user_id}: новых сделок {result[name]}")
+    return result
@@ -0,0 +1,214 @@
+"""
+Оценка портфеля пользователя в одной валюте котировки по всем биржам.
+
+Балансы бирж приводятся к словарю {актив: количество} с едиными
+названиями активов (Kraken хранит BTC как XXBT, доллар как ZUSD и т.д.),
+объединяются по активу и оцениваются по таблице цен.
+Таблица цен строится из ticker_cache, который раз в TICKER_REFRESH_INTERVAL
+секунд обновляет TickerRefresher: по одному запросу /get_tickers к каждой
+бирже из TICKER_SOURCES, сразу за все активы. Запросы страниц цены не
+запрашивают никогда — только читают кэш.
+Цены к USDT и другим долларовым стейблкоинам считаются ценами к доллару.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import backend.exchanges as exchanges
+import backend.services as services
+from backend.cache import ticker_cache
+
+logger = logging.getLogger(__name__)
+
+VALUATION_QUOTE = "USD"
+# Активы, которые оцениваются один к одному с долларом
+USD_ASSETS = {"USD", "USDT", "USDC", "BUSD", "DAI", "TUSD"}
+
+# Биржи-источники цен в порядке приоритета (у всех есть цены всех пар одним запросом)
+TICKER_SOURCES = [
+    name.strip() for name in os.getenv("TICKER_SOURCES", "binance,kraken,kucoin,mexc").split(",")
+    if name.strip()
+]
+TICKER_REFRESH_ENABLED = os.getenv("TICKER_REFRESH_ENABLED", "1") == "1"
+TICKER_REFRESH_INTERVAL = float(os.getenv("TICKER_REFRESH_INTERVAL", "60"))
+
+# Устаревшие коды активов Kraken
+KRAKEN_ASSETS = {
+    "XXBT": "BTC", "XBT": "BTC", "XXDG": "DOGE", "XDG": "DOGE",
+    "XETH": "ETH", "ETH2": "ETH", "XETC": "ETC", "XLTC": "LTC", "XMLN": "MLN", "XREP": "REP",
+    "XXLM": "XLM", "XXMR": "XMR", "XXRP": "XRP", "XZEC": "ZEC",
+    "ZUSD": "USD", "ZEUR": "EUR", "ZGBP": "GBP", "ZCAD": "CAD", "ZJPY": "JPY", "ZAUD": "AUD",
+}
+
+
+def normalize_asset(exchange: str, asset: str) -> str:
+    """Приводит название актива биржи к общему виду (BTC, ETH, USD...)."""
+    asset = asset.upper()
+    if exchange == "kraken":
+        # Суффиксы стейкинга и удержания: ETH2.S, DOT.S, USD.HOLD
+        asset = asset.split(".")[0]
+        asset = KRAKEN_ASSETS.get(asset, asset)
+    return asset
+
+
+def normalized_holdings(exchange: str, data) -> dict:
+    """Баланс биржи (JSON-ответ микросервиса) в виде {актив: количество} с общими названиями."""
+    holdings = {}
+    for asset, amount in exchanges.get_holdings(exchange, data).items():
+        asset = normalize_asset(exchange, asset)
+        holdings[asset] = holdings.get(asset, 0.0) + amount
+    return holdings
+
+
+def merge_holdings(balances: dict) -> dict:
+    """
+    Объединяет балансы нескольких бирж по активу.
+    :param balances: Словарь {биржа: JSON-ответ микросервиса}.
+    """
+    merged = {}
+    for exchange, data in balances.items():
+        for asset, amount in normalized_holdings(exchange, data).items():
+            merged[asset] = merged.get(asset, 0.0) + amount
+    return merged
+
+
+def get_price_table() -> dict:
+    """
+    Цены активов в VALUATION_QUOTE из кэша: при расхождении источников
+    берется цена источника с большим приоритетом в TICKER_SOURCES.
+    Пустой словарь, если цены еще ни разу не загружались.
+    """
+    prices = {}
+    for source in reversed(TICKER_SOURCES):
+        prices.update(ticker_cache.get(source) or {})
+    return prices
+
+
+def value_holdings(holdings: dict, prices: dict = None):
+    """
+    Оценивает активы по таблице цен.
+    :return: Пара (стоимость в VALUATION_QUOTE, список активов без цены).
+    """
+    if prices is None:
+        prices = get_price_table()
+    total = 0.0
+    unpriced = []
+    for asset, amount in holdings.items():
+        if asset in USD_ASSETS:
+            total += amount
+        elif asset in prices:
+            total += amount * prices[asset]
+        else:
+            unpriced.append(asset)
+    return total, unpriced
+
+
+def _total_value(holdings: dict):
+    """
+    Стоимость активов или None, если активов нет либо цены еще не
+    загружены, а среди активов есть не только долларовые.
+    """
+    if not holdings:
+        return None
+    prices = get_price_table()
+    if not prices and set(holdings) - USD_ASSETS:
+        return None
+    total, _ = value_holdings(holdings, prices)
+    return total
+
+
+def get_equity(exchange: str, data):
+    """Капитал на бирже в VALUATION_QUOTE по JSON-ответу микросервиса (или None)."""
+    return _total_value(normalized_holdings(exchange, data))
+
+
+def _load_stored(stored: dict) -> dict:
+    balances = {}
+    for name, row in stored.items():
+        try:
+            balances[name] = json.loads(row.balance)
+        except (TypeError, ValueError):
+            continue
+    return balances
+
+
+def stored_balance_details(stored: dict) -> dict:
+    """
+    Активы и стоимость сохраненного баланса каждой биржи.
+    :param stored: Словарь {биржа: models.Balance}.
+    :return: Словарь {биржа: {"holdings": {актив: количество}, "value": стоимость
+        в VALUATION_QUOTE или None}}; нераспознанный баланс дает пустые holdings.
+    """
+    prices = get_price_table()
+    balances = _load_stored(stored)
+    details = {}
+    for name in stored:
+        holdings = normalized_holdings(name, balances[name]) if name in balances else {}
+        value = None
+        if holdings and (prices or not set(holdings) - USD_ASSETS):
+            value, _ = value_holdings(holdings, prices)
+        details[name] = {"holdings": holdings, "value": value}
+    return details
+
+
+def value_stored_balances(stored: dict):
+    """
+    Общая стоимость сохраненных балансов пользователя.
+    :param stored: Словарь {биржа: models.Balance}.
+    :return: Стоимость в VALUATION_QUOTE или None, если оценить нечего.
+    """
+    return _total_value(merge_holdings(_load_stored(stored)))
+
+
+def refresh_tickers():
+    """Загружает цены всех активов с каждой биржи из TICKER_SOURCES в ticker_cache."""
+    for source in TICKER_SOURCES:
+        try:
+            resp = services.get(source, "/get_tickers")
+            resp.raise_for_status()
+            data = resp.json()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки цен {source}: {e}")
+            continue
+        prices = {}
+        for asset, price in data.get("prices", {}).items():
+            if price:
+                prices[normalize_asset(source, asset)] = float(price)
+        ticker_cache.set(source, prices)
+
+
+class TickerRefresher:
+    def __init__(self, interval: float = TICKER_REFRESH_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ticker-refresher", daemon=True)
+        self._thread.start()
+        logger.info(f"Фоновое обновление цен запущено, интервал {self.interval} сек.")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                refresh_tickers()
+            except Exception as e:
+                logger.error(f"Ошибка обновления цен: {e}")
+            self._stop.wait(max(started + self.interval - time.monotonic(), 0))
+
+
+ticker_refresher = TickerRefresher()
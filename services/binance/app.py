@@ -1,7 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from typing import Optional
 import os
+import json
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceRequestException
@@ -12,6 +17,72 @@ load_dotenv()
 
 app = FastAPI()
 
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
+# Котируемые валюты, по которым из символа пары выделяется базовый актив
+QUOTE_ASSETS = ("USDT", "BUSD", "USDC", "BTC", "ETH", "BNB")
+
+
+def _base_asset(symbol: str) -> str:
+    for quote in QUOTE_ASSETS:
+        if symbol.endswith(quote) and symbol != quote:
+            return symbol[:-len(quote)]
+    return symbol
+
 
 @app.get("/get_balance")
 def get_balance(
@@ -31,7 +102,7 @@ def get_balance(
             status_code=500, detail="Отсутствуют API ключи Binance")
 
     try:
-        client = Client(api_key, secret_key)
+        client = client_pool.get(Client, api_key, secret_key)
         account_info = client.get_account()
         # Собираем словарь вида {"balance": <число>} или что‑то подобное
         balances = {}
@@ -44,4 +115,95 @@ def get_balance(
         return balances
     except (BinanceAPIException, BinanceRequestException) as e:
         logger.error(f"Ошибка обращения к API Binance: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка API Binance: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ошибка API Binance: {e}")
+
+
+@app.get("/get_trades")
+def get_trades(
+    token: Optional[str] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    since: Optional[str] = None,
+    symbols: Optional[str] = None
+):
+    """
+    Возвращает сделки аккаунта, появившиеся после курсора since.
+    Binance отдает сделки только по конкретной паре, поэтому курсор — JSON
+    вида {"BTCUSDT": <id последней сделки>}. Если symbols (через запятую) не
+    переданы, берутся пары к USDT для всех активов с ненулевым балансом и
+    пары, уже встречавшиеся в курсоре.
+    """
+    if not api_key:
+        api_key = os.getenv("BINANCE_API_KEY")
+    if not secret_key:
+        secret_key = os.getenv("BINANCE_SECRET_KEY")
+
+    if not api_key or not secret_key:
+        logger.error("API ключи Binance не установлены")
+        raise HTTPException(
+            status_code=500, detail="Отсутствуют API ключи Binance")
+
+    try:
+        cursor = json.loads(since) if since else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    try:
+        client = client_pool.get(Client, api_key, secret_key)
+        if symbols:
+            symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        else:
+            account_info = client.get_account()
+            symbol_list = {
+                f"{asset['asset']}USDT" for asset in account_info.get("balances", [])
+                if asset["asset"] != "USDT" and float(asset["free"]) + float(asset["locked"]) > 0
+            }
+            symbol_list = sorted(symbol_list | set(cursor))
+
+        trades = []
+        for symbol in symbol_list:
+            params = {"symbol": symbol, "limit": 1000}
+            if symbol in cursor:
+                params["fromId"] = cursor[symbol] + 1
+            try:
+                fills = client.get_my_trades(**params)
+            except BinanceAPIException as e:
+                # Например, у актива нет пары к USDT
+                logger.warning(f"Пропущена пара {symbol}: {e}")
+                continue
+            for fill in fills:
+                trades.append({
+                    "id": str(fill["id"]),
+                    "symbol": symbol,
+                    "asset": _base_asset(symbol),
+                    "side": "buy" if fill["isBuyer"] else "sell",
+                    "price": float(fill["price"]),
+                    "qty": float(fill["qty"]),
+                    "fee": float(fill["commission"]),
+                    "time": int(fill["time"]),
+                })
+                cursor[symbol] = max(cursor.get(symbol, 0), int(fill["id"]))
+        return {"trades": trades, "cursor": json.dumps(cursor)}
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logger.error(f"Ошибка обращения к API Binance: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Binance: {e}")
+
+
+
+@app.get("/get_tickers")
+def get_tickers():
+    """
+    Последние цены всех активов к USDT одним запросом (публичный эндпоинт,
+    ключи не нужны): {"quote": "USDT", "prices": {"BTC": 65000.0, ...}}.
+    """
+    try:
+        client = client_pool.get(Client)
+        prices = {}
+        for ticker in client.get_all_tickers():
+            symbol = ticker["symbol"]
+            if symbol.endswith("USDT") and symbol != "USDT":
+                prices[symbol[:-len("USDT")]] = float(ticker["price"])
+        return {"quote": "USDT", "prices": prices}
+    except (BinanceAPIException, BinanceRequestException) as e:
+        logger.error(f"Ошибка получения цен Binance: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Binance: {e}")
@@ -2,6 +2,10 @@ from fastapi import FastAPI, HTTPException
 from typing import Optional
 import os
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 # Импортируем BitgetFuturesClient из нашего пакета
@@ -13,6 +17,68 @@ load_dotenv()
 
 app = FastAPI(title="Bitget Futures API")
 
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
+# Стороны сделок фьючерсов, которые соответствуют покупке контракта
+BUY_SIDES = ("open_long", "close_short", "buy_single", "buy")
+# Bitget отдает не больше 100 сделок за запрос
+FILLS_PAGE_SIZE = 100
+TRADES_MAX_REQUESTS = int(os.getenv("BITGET_TRADES_MAX_REQUESTS", "20"))
+
 
 @app.get("/get_balance")
 def get_balance(
@@ -36,8 +102,8 @@ def get_balance(
 
     try:
         # Создаем экземпляр клиента для фьючерсного API
-        client = BitgetFuturesClient(
-            api_key, secret_key, passphrase, debug=True)
+        client = client_pool.get(
+            BitgetFuturesClient, api_key, secret_key, passphrase, debug=True)
         # Получаем информацию о счёте
         account_info = client.get_account_info(product_type="umcbl")
 
@@ -61,6 +127,92 @@ def get_balance(
         raise HTTPException(status_code=500, detail=f"Ошибка API Bitget: {e}")
 
 
+@app.get("/get_trades")
+def get_trades(
+    token: Optional[str] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    passphrase: Optional[str] = None,
+    since: Optional[str] = None
+):
+    """
+    Возвращает сделки фьючерсного счета, появившиеся после курсора since.
+    Курсор — время (мс), до которого сделки уже получены.
+    """
+    if not api_key:
+        api_key = os.getenv("BITGET_API_KEY")
+    if not secret_key:
+        secret_key = os.getenv("BITGET_SECRET_KEY")
+    if not passphrase:
+        passphrase = os.getenv("BITGET_PASSPHRASE")
+
+    if not api_key or not secret_key or not passphrase:
+        logger.error("API ключи Bitget или passphrase не установлены")
+        raise HTTPException(
+            status_code=500, detail="Отсутствуют API ключи Bitget или passphrase")
+
+    try:
+        client = client_pool.get(
+            BitgetFuturesClient, api_key, secret_key, passphrase, debug=False)
+        # Bitget отдает не больше FILLS_PAGE_SIZE сделок за период, начиная с
+        # новых. Полный ответ значит, что в периоде есть и более старые сделки:
+        # тогда конец периода сдвигается к самой старой полученной сделке (но
+        # не дальше середины периода), пока период не поместится в ответ.
+        # Периоды читаются от старых к новым, а курсор сдвигается только до
+        # конца прочитанного целиком периода, поэтому сделки за пределами
+        # TRADES_MAX_REQUESTS запросов придут при следующей синхронизации.
+        start_time = int(since) + 1 if since else 0
+        now = int(time.time() * 1000)
+        ends = [now]
+        fills = []
+        cursor = since
+        for _ in range(TRADES_MAX_REQUESTS):
+            end_time = ends[-1]
+            page = client.get_all_fills(
+                product_type="umcbl", start_time=start_time, end_time=end_time).get("data") or []
+            if len(page) >= FILLS_PAGE_SIZE:
+                oldest = min(int(fill["cTime"]) for fill in page)
+                narrowed = min(oldest, start_time + (end_time - start_time) // 2)
+                if start_time <= narrowed < end_time:
+                    ends.append(narrowed)
+                    continue
+            fills.extend(page)
+            ends.pop()
+            if end_time < now:
+                cursor = str(end_time)
+            elif page:
+                # Последний период заканчивается текущим временем: курсор —
+                # последняя сделка, чтобы не пропустить еще не видимые в API
+                cursor = str(max(int(fill["cTime"]) for fill in page))
+            if not ends:
+                break
+            start_time = end_time + 1
+
+        trades = []
+        for fill in fills:
+            created_at = int(fill["cTime"])
+            symbol = fill["symbol"]
+            # BTCUSDT_UMCBL -> BTC
+            asset = symbol.split("_")[0]
+            if asset.endswith("USDT") and asset != "USDT":
+                asset = asset[:-len("USDT")]
+            trades.append({
+                "id": str(fill["tradeId"]),
+                "symbol": symbol,
+                "asset": asset,
+                "side": "buy" if fill.get("side") in BUY_SIDES else "sell",
+                "price": float(fill["price"]),
+                "qty": float(fill["sizeQty"]),
+                "fee": abs(float(fill.get("fee") or 0)),
+                "time": created_at,
+            })
+        return {"trades": trades, "cursor": cursor}
+
+    except Exception as e:
+        logger.error(f"Ошибка обращения к API Bitget: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Bitget: {e}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -106,3 +106,20 @@ class BitgetFuturesClient:
         endpoint = "/account/accounts"
         params = {"productType": product_type}
         return self._request("GET", endpoint, params=params)
+
+    def get_all_fills(self, product_type="umcbl", start_time=None, end_time=None):
+        """
+        Получает исполненные сделки по всем фьючерсным контрактам за период.
+
+        :param product_type: Тип продукта (например, "umcbl" для USDT‑фьючерсов)
+        :param start_time: Начало периода в миллисекундах
+        :param end_time: Конец периода в миллисекундах (по умолчанию — текущее время)
+        :return: JSON со списком сделок в поле data
+        """
+        endpoint = "/order/allFills"
+        params = {
+            "productType": product_type,
+            "startTime": start_time if start_time is not None else 0,
+            "endTime": end_time if end_time is not None else int(time.time() * 1000),
+        }
+        return self._request("GET", endpoint, params=params)
@@ -1,6 +1,11 @@
 from fastapi import FastAPI, HTTPException
 from typing import Optional
-import os, logging
+import os, json, logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 import cbpro  # pip install cbpro
 from dotenv import load_dotenv
 
@@ -10,6 +15,62 @@ load_dotenv()
 
 app = FastAPI()
 
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
 @app.get("/get_balance")
 def get_balance(
     token: Optional[str] = None,
@@ -33,7 +94,7 @@ def get_balance(
         raise HTTPException(status_code=500, detail="Отсутствуют API ключи Coinbase Pro")
 
     try:
-        client = cbpro.AuthenticatedClient(api_key, secret_key, passphrase)
+        client = client_pool.get(cbpro.AuthenticatedClient, api_key, secret_key, passphrase)
         accounts = client.get_accounts()  # Возвращает список аккаунтов
         # Для упрощения вернем словарь, в котором key = валюта, value = баланс
         balance_dict = {}
@@ -46,3 +107,71 @@ def get_balance(
     except Exception as e:
         logger.error(f"Ошибка обращения к API Coinbase Pro: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка API Coinbase Pro: {e}")
+
+
+@app.get("/get_trades")
+def get_trades(
+    token: Optional[str] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    passphrase: Optional[str] = None,
+    since: Optional[str] = None,
+    symbols: Optional[str] = None
+):
+    """
+    Возвращает сделки (fills), появившиеся после курсора since.
+    Coinbase Pro отдает fills только по конкретному продукту, поэтому курсор —
+    JSON вида {"BTC-USD": <trade_id последней сделки>}. Если symbols
+    (через запятую) не переданы, берутся продукты к USD для всех валют
+    с ненулевым балансом и продукты, уже встречавшиеся в курсоре.
+    """
+    if not api_key:
+        api_key = os.getenv("CBPRO_API_KEY")
+    if not secret_key:
+        secret_key = os.getenv("CBPRO_SECRET_KEY")
+    if not passphrase:
+        passphrase = os.getenv("CBPRO_PASSPHRASE")
+
+    if not api_key or not secret_key or not passphrase:
+        logger.error("API ключи Coinbase Pro не установлены")
+        raise HTTPException(status_code=500, detail="Отсутствуют API ключи Coinbase Pro")
+
+    try:
+        cursor = json.loads(since) if since else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    try:
+        client = client_pool.get(cbpro.AuthenticatedClient, api_key, secret_key, passphrase)
+        if symbols:
+            products = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        else:
+            products = {
+                f"{acc['currency']}-USD" for acc in client.get_accounts()
+                if acc.get("currency") not in (None, "USD") and float(acc.get("balance") or 0) > 0
+            }
+            products = sorted(products | set(cursor))
+
+        trades = []
+        for product in products:
+            last_id = cursor.get(product, 0)
+            # fills идут от новых к старым: читаем страницы, пока не дойдем до курсора
+            for fill in client.get_fills(product_id=product):
+                if not isinstance(fill, dict) or int(fill["trade_id"]) <= last_id:
+                    break
+                created_at = datetime.fromisoformat(fill["created_at"].replace("Z", "+00:00"))
+                trades.append({
+                    "id": str(fill["trade_id"]),
+                    "symbol": product,
+                    "asset": product.split("-")[0],
+                    "side": fill["side"],
+                    "price": float(fill["price"]),
+                    "qty": float(fill["size"]),
+                    "fee": float(fill.get("fee") or 0),
+                    "time": int(created_at.timestamp() * 1000),
+                })
+                cursor[product] = max(cursor.get(product, 0), int(fill["trade_id"]))
+        return {"trades": trades, "cursor": json.dumps(cursor)}
+    except Exception as e:
+        logger.error(f"Ошибка обращения к API Coinbase Pro: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Coinbase Pro: {e}")
@@ -1,14 +1,95 @@
 # services/kraken/app.py
 from fastapi import FastAPI, HTTPException
+from typing import Optional
 import krakenex
 import os
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
+# Kraken отдает историю сделок страницами по 50 записей
+TRADES_PAGE_SIZE = 50
+TRADES_MAX_PAGES = int(os.getenv("KRAKEN_TRADES_MAX_PAGES", "20"))
+# Котируемые валюты, по которым из названия пары выделяется базовый актив
+QUOTE_ASSETS = ("ZUSD", "USDT", "USD", "ZEUR", "EUR")
+
+
+def _base_asset(pair: str) -> str:
+    for quote in QUOTE_ASSETS:
+        if pair.endswith(quote) and pair != quote:
+            return pair[:-len(quote)]
+    return pair
+
+
+def _private_client(api_key: str, secret_key: str):
+    """Клиент Kraken с загруженными ключами (создается через client_pool)."""
+    k = krakenex.API()
+    k.load_key(api_key, secret_key)
+    return k
+
 
 @app.get("/get_balance")
 def get_balance(token: str = None):
@@ -20,10 +101,107 @@ def get_balance(token: str = None):
         raise HTTPException(
             status_code=500, detail="Отсутствуют API ключи Kraken")
     try:
-        k = krakenex.API()
-        k.load_key(api_key, secret_key)
+        k = client_pool.get(_private_client, api_key, secret_key)
         balance = k.query_private('Balance')
         return balance
     except Exception as e:
         logger.error(f"Ошибка получения баланса Kraken: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка API Kraken: {e}")
+
+
+
+@app.get("/get_trades")
+def get_trades(
+    token: Optional[str] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    since: Optional[str] = None
+):
+    """
+    Возвращает сделки аккаунта, появившиеся после курсора since.
+    Курсор — время (unix, сек.) последней полученной сделки.
+    """
+    if not api_key:
+        api_key = os.getenv("KRAKEN_API_KEY")
+    if not secret_key:
+        secret_key = os.getenv("KRAKEN_SECRET_KEY")
+    if not api_key or not secret_key:
+        logger.error("API ключи Kraken не установлены")
+        raise HTTPException(
+            status_code=500, detail="Отсутствуют API ключи Kraken")
+    try:
+        k = client_pool.get(_private_client, api_key, secret_key)
+        # start исключает сделку с указанным временем
+        query = {"start": since} if since else {}
+
+        def fetch_page(offset):
+            response = k.query_private('TradesHistory', dict(query, ofs=offset))
+            if response.get("error"):
+                raise Exception(", ".join(response["error"]))
+            return response.get("result", {})
+
+        # Kraken отдает сделки от новых к старым, поэтому страницы читаются с
+        # конца (самые старые сделки). Если не все страницы уместились в
+        # TRADES_MAX_PAGES, курсор дойдет только до последней полученной
+        # сделки, а остальные придут при следующей синхронизации.
+        first = fetch_page(0)
+        count = int(first.get("count") or 0)
+        last_offset = max(count - 1, 0) // TRADES_PAGE_SIZE * TRADES_PAGE_SIZE
+        offsets = range(last_offset, -1, -TRADES_PAGE_SIZE)
+        truncated = len(offsets) > TRADES_MAX_PAGES
+        fills = {}
+        for offset in offsets[:TRADES_MAX_PAGES]:
+            # Новые сделки сдвигают смещения вперед: страницы могут
+            # пересекаться, но не пропускать сделки
+            fills.update((first if offset == 0 else fetch_page(offset)).get("trades", {}))
+        if truncated and fills:
+            # Сделки с тем же временем, что и самая новая, могли остаться на
+            # непрочитанной странице, а start их исключит: они придут в следующий раз
+            newest = max(float(fill["time"]) for fill in fills.values())
+            older = {txid: fill for txid, fill in fills.items() if float(fill["time"]) < newest}
+            fills = older or fills
+
+        trades = []
+        cursor = since
+        for txid, fill in fills.items():
+            trades.append({
+                "id": txid,
+                "symbol": fill["pair"],
+                "asset": _base_asset(fill["pair"]),
+                "side": fill["type"],
+                "price": float(fill["price"]),
+                "qty": float(fill["vol"]),
+                "fee": float(fill.get("fee", 0)),
+                "time": int(float(fill["time"]) * 1000),
+            })
+            if cursor is None or float(fill["time"]) > float(cursor):
+                cursor = str(fill["time"])
+        return {"trades": trades, "cursor": cursor}
+    except Exception as e:
+        logger.error(f"Ошибка получения сделок Kraken: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Kraken: {e}")
+
+
+
+@app.get("/get_tickers")
+def get_tickers():
+    """
+    Последние цены всех активов к доллару одним запросом (публичный
+    эндпоинт): {"quote": "USD", "prices": {"XXBT": 65000.0, ...}}.
+    Названия активов остаются в формате Kraken.
+    """
+    try:
+        k = client_pool.get(krakenex.API)
+        response = k.query_public('Ticker')
+        if response.get("error"):
+            raise Exception(", ".join(response["error"]))
+        prices = {}
+        for pair, ticker in response.get("result", {}).items():
+            for quote in ("ZUSD", "USD"):
+                if pair.endswith(quote) and pair != quote:
+                    prices[pair[:-len(quote)]] = float(ticker["c"][0])
+                    break
+        return {"quote": "USD", "prices": prices}
+    except Exception as e:
+        logger.error(f"Ошибка получения цен Kraken: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API Kraken: {e}")
@@ -1,7 +1,12 @@
 # services/kucoin/app.py
 from fastapi import FastAPI, HTTPException
+from typing import Optional
 import os
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 #from kucoin.client import Client  # Исправленный импорт
 from kucoin.client import Client
 
@@ -10,6 +15,66 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Kucoin returns fills in pages of up to 500 items
+TRADES_PAGE_SIZE = 500
+TRADES_MAX_PAGES = int(os.getenv("KUCOIN_TRADES_MAX_PAGES", "20"))
+
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
 
 @app.get("/get_balance")
 def get_balance(token: str = None):
@@ -23,7 +88,7 @@ def get_balance(token: str = None):
             status_code=500, detail="Missing Kucoin API credentials")
     try:
         # Создаем клиента Kucoin
-        client = Client(api_key, secret_key, passphrase)
+        client = client_pool.get(Client, api_key, secret_key, passphrase)
         # Пример запроса баланса (метод может отличаться, см. документацию)
         accounts = client.get_accounts()
         # Отфильтровываем аккаунты с ненулевым балансом
@@ -35,3 +100,90 @@ def get_balance(token: str = None):
     except Exception as e:
         logger.error(f"Error fetching Kucoin balance: {e}")
         raise HTTPException(status_code=500, detail=f"Kucoin API error: {e}")
+
+
+
+@app.get("/get_trades")
+def get_trades(
+    token: Optional[str] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    passphrase: Optional[str] = None,
+    since: Optional[str] = None
+):
+    """
+    Returns account fills newer than the since cursor.
+    The cursor is the createdAt (ms) of the latest returned fill.
+    """
+    api_key = api_key or os.getenv("KUCOIN_API_KEY")
+    secret_key = secret_key or os.getenv("KUCOIN_SECRET_KEY")
+    passphrase = passphrase or os.getenv("KUCOIN_API_PASSPHRASE")
+    if not api_key or not secret_key or not passphrase:
+        logger.error("Kucoin API keys or passphrase are not set")
+        raise HTTPException(
+            status_code=500, detail="Missing Kucoin API credentials")
+    try:
+        client = client_pool.get(Client, api_key, secret_key, passphrase)
+        params = {"limit": TRADES_PAGE_SIZE}
+        if since:
+            params["start"] = int(since) + 1
+        # Kucoin returns fills newest first, so pages are read from the last
+        # (oldest) one. If they do not fit into TRADES_MAX_PAGES, the cursor
+        # only moves up to the newest fill actually returned.
+        first = client.get_fills(page=1, **params)
+        total_pages = int(first.get("totalPage") or 1)
+        pages = range(total_pages, 0, -1)
+        truncated = len(pages) > TRADES_MAX_PAGES
+        fills = {}
+        for page in pages[:TRADES_MAX_PAGES]:
+            # New fills shift pages forward: pages may overlap but never skip fills
+            items = (first if page == 1 else client.get_fills(page=page, **params)).get("items", [])
+            fills.update((str(fill["tradeId"]), fill) for fill in items)
+        if truncated and fills:
+            # Fills sharing the newest timestamp may continue on an unread page
+            newest = max(int(fill["createdAt"]) for fill in fills.values())
+            older = {key: fill for key, fill in fills.items() if int(fill["createdAt"]) < newest}
+            fills = older or fills
+
+        trades = []
+        cursor = since
+        for fill in fills.values():
+            created_at = int(fill["createdAt"])
+            trades.append({
+                "id": str(fill["tradeId"]),
+                "symbol": fill["symbol"],
+                "asset": fill["symbol"].split("-")[0],
+                "side": fill["side"],
+                "price": float(fill["price"]),
+                "qty": float(fill["size"]),
+                "fee": float(fill.get("fee", 0)),
+                "time": created_at,
+            })
+            if cursor is None or created_at > int(cursor):
+                cursor = str(created_at)
+        return {"trades": trades, "cursor": cursor}
+    except Exception as e:
+        logger.error(f"Error fetching Kucoin fills: {e}")
+        raise HTTPException(status_code=500, detail=f"Kucoin API error: {e}")
+
+
+
+@app.get("/get_tickers")
+def get_tickers():
+    """
+    Latest prices of all assets against USDT in one request (public endpoint):
+    {"quote": "USDT", "prices": {"BTC": 65000.0, ...}}.
+    """
+    try:
+        # Public endpoint: the client only needs placeholder credentials
+        client = client_pool.get(Client, "", "", "")
+        tickers = client.get_ticker()
+        prices = {}
+        for ticker in tickers.get("ticker", []):
+            base, _, quote = ticker["symbol"].partition("-")
+            if quote == "USDT" and ticker.get("last"):
+                prices[base] = float(ticker["last"])
+        return {"quote": "USDT", "prices": prices}
+    except Exception as e:
+        logger.error(f"Error fetching Kucoin tickers: {e}")
+        raise HTTPException(status_code=500, detail=f"Kucoin API error: {e}")
@@ -1,8 +1,11 @@
 import time
+import json
 import hashlib
 import requests
 import os
 import logging
+import threading
+from collections import OrderedDict
 from fastapi import FastAPI, HTTPException
 
 logging.basicConfig(level=logging.INFO)
@@ -59,9 +62,94 @@ class MEXCClient:
         response.raise_for_status()
         return response.json()
 
+    def get_tickers(self):
+        """Последние цены всех пар (публичный запрос, подпись не нужна)."""
+        endpoint = "/open/api/v2/market/ticker"
+        response = self.session.get(self.base_url + endpoint)
+        response.raise_for_status()
+        return response.json()
+
+    def get_deals(self, symbol, start_time=None, limit=1000):
+        """Сделки аккаунта по паре (например, BTC_USDT), начиная с start_time (мс)."""
+        endpoint = "/open/api/v2/order/deals"
+        url = self.base_url + endpoint
+        req_time = self.get_server_timestamp() + self.additional_offset
+        params = {
+            "api_key": self.api_key,
+            "req_time": req_time,
+            "symbol": symbol,
+            "limit": limit
+        }
+        if start_time is not None:
+            params["start_time"] = start_time
+        params["sign"] = self._generate_signature(params)
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
 
 app = FastAPI(title="MEXC API Service")
 
+# MEXC отдает не больше 1000 сделок пары за запрос
+DEALS_PAGE_SIZE = 1000
+TRADES_MAX_PAGES = int(os.getenv("MEXC_TRADES_MAX_PAGES", "10"))
+
+# Пул клиентов биржи: размер и время простоя (сек.), после которого клиент удаляется
+CLIENT_POOL_SIZE = int(os.getenv("CLIENT_POOL_SIZE", "256"))
+CLIENT_POOL_IDLE_TTL = float(os.getenv("CLIENT_POOL_IDLE_TTL", "600"))
+
+
+class ClientPool:
+    """
+    Готовые клиенты биржи по sha256 от учетных данных и параметров клиента.
+    Клиент и его HTTP-сессия переживают запрос, поэтому настройка клиента и
+    TLS-рукопожатие не повторяются на каждом вызове. Клиенты, простаивавшие
+    дольше idle_ttl, и самые давно использованные сверх maxsize удаляются
+    из пула; их соединения закрываются сборщиком мусора, когда клиентом
+    перестанет пользоваться последний запрос.
+    """
+
+    def __init__(self, maxsize: int = CLIENT_POOL_SIZE, idle_ttl: float = CLIENT_POOL_IDLE_TTL):
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(factory, args, kwargs) -> str:
+        raw = repr((factory.__qualname__, args, sorted(kwargs.items())))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _evict(self, now: float):
+        while self._clients:
+            key, (_, last_used) = next(iter(self._clients.items()))
+            if len(self._clients) <= self.maxsize and now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+
+    def get(self, factory, *args, **kwargs):
+        """Клиент factory(*args, **kwargs) из пула; создается при первом обращении."""
+        key = self._key(factory, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                return entry[0]
+        # Конструктор может ходить в сеть, поэтому создается без блокировки
+        client = factory(*args, **kwargs)
+        with self._lock:
+            entry = self._clients.setdefault(key, [client, now])
+            self._clients.move_to_end(key)
+            self._evict(now)
+        return entry[0]
+
+
+client_pool = ClientPool()
+
+
 
 @app.get("/get_balance")
 def get_balance(token: str = None, api_key: str = None, secret_key: str = None):
@@ -76,10 +164,127 @@ def get_balance(token: str = None, api_key: str = None, secret_key: str = None):
             status_code=500, detail="Отсутствуют API ключи MEXC")
 
     try:
-        client = MEXCClient(api_key, secret_key,
-                            debug=True, additional_offset=1000)
+        client = client_pool.get(MEXCClient, api_key, secret_key,
+                                 debug=True, additional_offset=1000)
         account_info = client.get_account_info()
         return account_info
     except Exception as e:
         logger.error(f"Ошибка получения баланса MEXC: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка API MEXC: {e}")
+
+
+
+def _fetch_deals(client, symbol: str, start_time=None) -> list:
+    """
+    Сделки пары после start_time (мс) от старых к новым.
+    Полная страница значит, что сделок могло быть больше: следующая
+    страница запрашивается от времени самой новой сделки (повторы
+    отбрасываются по id). Если страницы не закончились за
+    TRADES_MAX_PAGES запросов, сделки с временем самой новой не
+    возвращаются — они могут продолжаться на непрочитанной странице, а
+    курсор не должен перескочить через них.
+    """
+    deals = {}
+    truncated = False
+    for page in range(TRADES_MAX_PAGES):
+        response = client.get_deals(symbol, start_time=start_time, limit=DEALS_PAGE_SIZE)
+        if response.get("code") != 200:
+            logger.warning(f"Пропущена пара {symbol}: {response}")
+            # Прочитанные страницы идут подряд от старых сделок, их можно сохранить
+            truncated = page > 0
+            break
+        data = response.get("data") or []
+        for deal in data:
+            deals[str(deal.get("id") or f"{deal['order_id']}:{deal['create_time']}")] = deal
+        if len(data) < DEALS_PAGE_SIZE:
+            break
+        times = [int(deal["create_time"]) for deal in data]
+        if times[0] > times[-1]:
+            # Страница от новых к старым: более старые сделки недоступны по start_time
+            logger.warning(f"Пара {symbol}: сделок больше {DEALS_PAGE_SIZE}, старые могут быть пропущены")
+            break
+        start_time = max(times)
+    else:
+        truncated = True
+    result = sorted(deals.values(), key=lambda deal: int(deal["create_time"]))
+    if truncated and result:
+        newest = int(result[-1]["create_time"])
+        result = [deal for deal in result if int(deal["create_time"]) < newest] or result
+    return result
+
+
+@app.get("/get_trades")
+def get_trades(token: str = None, api_key: str = None, secret_key: str = None,
+               since: str = None, symbols: str = None):
+    """
+    Возвращает сделки аккаунта, появившиеся после курсора since.
+    Курсор — JSON вида {"BTC_USDT": <время последней сделки, мс>}. Если symbols
+    (через запятую) не переданы, берутся пары к USDT для всех активов из баланса
+    и пары, уже встречавшиеся в курсоре.
+    """
+    if not api_key:
+        api_key = os.getenv("MEXC_API_KEY")
+    if not secret_key:
+        secret_key = os.getenv("MEXC_SECRET_KEY")
+
+    if not api_key or not secret_key:
+        logger.error("API ключи MEXC не установлены")
+        raise HTTPException(
+            status_code=500, detail="Отсутствуют API ключи MEXC")
+
+    try:
+        cursor = json.loads(since) if since else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    try:
+        client = client_pool.get(MEXCClient, api_key, secret_key, additional_offset=1000)
+        if symbols:
+            symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+        else:
+            balances = client.get_account_info().get("data", {})
+            symbol_list = {f"{asset}_USDT" for asset in balances if asset != "USDT"}
+            symbol_list = sorted(symbol_list | set(cursor))
+
+        trades = []
+        for symbol in symbol_list:
+            last_time = cursor.get(symbol)
+            start_time = last_time + 1 if last_time is not None else None
+            for deal in _fetch_deals(client, symbol, start_time):
+                create_time = int(deal["create_time"])
+                trades.append({
+                    "id": str(deal.get("id") or f"{deal['order_id']}:{create_time}"),
+                    "symbol": symbol,
+                    "asset": symbol.split("_")[0],
+                    "side": "buy" if deal["trade_type"] == "BID" else "sell",
+                    "price": float(deal["deal_price"]),
+                    "qty": float(deal["deal_quantity"]),
+                    "fee": float(deal.get("fee") or 0),
+                    "time": create_time,
+                })
+                cursor[symbol] = max(cursor.get(symbol, 0), create_time)
+        return {"trades": trades, "cursor": json.dumps(cursor)}
+    except Exception as e:
+        logger.error(f"Ошибка получения сделок MEXC: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API MEXC: {e}")
+
+
+
+@app.get("/get_tickers")
+def get_tickers():
+    """
+    Последние цены всех активов к USDT одним запросом (публичный эндпоинт,
+    ключи не нужны): {"quote": "USDT", "prices": {"BTC": 65000.0, ...}}.
+    """
+    try:
+        client = client_pool.get(MEXCClient, "", "")
+        response = client.get_tickers()
+        prices = {}
+        for ticker in response.get("data") or []:
+            base, _, quote = ticker["symbol"].partition("_")
+            if quote == "USDT" and ticker.get("last"):
+                prices[base] = float(ticker["last"])
+        return {"quote": "USDT", "prices": prices}
+    except Exception as e:
+        logger.error(f"Ошибка получения цен MEXC: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка API MEXC: {e}")